@@ -1,71 +1,162 @@
 import os
 import glob
-import yaml
-from simulator import simulate_onboarding
+import io
+import threading
+from collections import OrderedDict
+from cache import load_funnel, config_hash
+from loader import CONFIG_EXTENSIONS
+from simulator import simulate_many
+from profiling import Profiler, phase
+from graph import funnel_dot
+from sankey import sankey_data, START, SUCCESS, FAILED, OTHER
+import numpy as np
 import pandas as pd
 import streamlit as st
-import seaborn as sns
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
+
+# Bounds for the memoized simulations and figures shared across reruns
+SIMULATION_CACHE_SIZE = 64
+FIGURE_CACHE_SIZE = 64
+# Larger funnels collapse their lowest-volume modules into one Sankey node
+SANKEY_MAX_MODULES = 40
+# Larger funnels draw only the neighborhood of a selected module
+GRAPH_MAX_MODULES = 60
+BAR_COLORS = [
+    '#4c72b0', '#dd8452', '#55a868', '#c44e52', '#8172b3',
+    '#937860', '#da8bc3', '#8c8c8c', '#ccb974', '#64b5cd',
+]
 
 def main():
     st.title("Onboarding Funnel Simulation Dashboard")
 
     # Sidebar for configuration selection
     st.sidebar.title("Configuration Selection")
-    config_files = glob.glob('configs/*.yaml')
+    config_files = [path for extension in CONFIG_EXTENSIONS for path in glob.glob(f'configs/*{extension}')]
     config_files.sort()
     selected_configs = st.sidebar.multiselect(
         "Select Configuration(s)", config_files, default=config_files[0:1]
     )
 
     customers_count = st.sidebar.number_input("Number of Customers", min_value=1, value=100)
+    cpu_count = os.cpu_count() or 1
+    max_workers = st.sidebar.number_input(
+        "Worker Processes", min_value=1, max_value=cpu_count, value=cpu_count,
+        help="Simulations for multiple configurations run in parallel across this many processes."
+    )
+    top_k_paths = st.sidebar.number_input(
+        "Paths to Analyse", min_value=0, value=1000,
+        help="Only the most probable paths are listed in Path Analysis. Set to 0 to enumerate every path."
+    )
+    profile = st.sidebar.checkbox(
+        "Profile Simulation", value=False,
+        help="Record time and memory per simulation phase and show them under Profiling."
+    )
 
     if st.sidebar.button("Run Simulation"):
         if not selected_configs:
             st.warning("Please select at least one configuration.")
             return
+        # Remember the run so later widget interactions re-render it from
+        # the memo instead of clearing the page
+        st.session_state.simulation_request = (tuple(selected_configs), customers_count, int(top_k_paths), profile)
+
+    if 'simulation_request' not in st.session_state:
+        return
+    selected_configs, customers_count, top_k_paths, profile = st.session_state.simulation_request
+    profiler = Profiler() if profile else None
+
+    all_results = []
+    comparative_stats = []
 
-        all_results = []
-        comparative_stats = []
+    # Run the simulations that are not memoized yet, in parallel
+    with phase(profiler, 'run simulations'):
+        simulations = run_simulations(selected_configs, customers_count, top_k_paths, int(max_workers), profile)
 
-        for config_file in selected_configs:
-            # Run simulation for each selected configuration
-            results_df, summary_stats, path_metrics = simulate_onboarding(customers_count, config_file)
-            config_name = os.path.basename(config_file)
-            config_name = os.path.splitext(config_name)[0]
+    for config_file, (results_df, summary_stats, path_metrics) in zip(selected_configs, simulations):
+        config_name = os.path.basename(config_file)
+        config_name = os.path.splitext(config_name)[0]
 
-            # Collect results and statistics
-            all_results.append((config_name, results_df, summary_stats, config_file, path_metrics))
+        # Collect results and statistics
+        all_results.append((config_name, results_df, summary_stats, config_file, path_metrics))
 
-            # Extract key statistics for comparison
-            stats = summary_stats['metrics']
-            stats['Configuration'] = config_name
-            comparative_stats.append(stats)
+        # Extract key statistics for comparison
+        stats = dict(summary_stats['metrics'])
+        stats['Configuration'] = config_name
+        comparative_stats.append(stats)
 
-        # Display comparative results
+    # Display comparative results
+    with phase(profiler, 'render results'):
         if len(selected_configs) == 1:
             # Single configuration selected
             config_name, results_df, summary_stats, config_file, path_metrics = all_results[0]
-            display_single_configuration(config_name, results_df, summary_stats, config_file, path_metrics, customers_count)
+            display_single_configuration(
+                config_name, results_df, summary_stats, config_file, path_metrics, customers_count, profiler
+            )
         else:
             # Multiple configurations selected
             display_comparative_results(all_results, comparative_stats, selected_configs, customers_count)
 
-def display_single_configuration(config_name, results_df, summary_stats, config_file, path_metrics, customers_count):
+    if profiler is not None:
+        display_profile(all_results, profiler)
+
+def display_profile(all_results, profiler):
+    # Simulation phases were recorded where each simulation ran (possibly a
+    # worker process, possibly an earlier run served from the memo);
+    # dashboard phases were recorded during this rerun
+    with st.expander("Profiling"):
+        for config_name, _, summary_stats, _, _ in all_results:
+            if 'profile' in summary_stats:
+                st.markdown(f"#### Simulation: {config_name}")
+                st.dataframe(summary_stats['profile'].to_frame())
+        st.markdown("#### Dashboard")
+        st.dataframe(profiler.to_frame())
+
+@st.cache_resource
+def simulation_memo():
+    # One LRU of simulation results per server, keyed by
+    # (config content hash, customers_count, top_k_paths, profile)
+    return OrderedDict(), threading.Lock()
+
+def run_simulations(config_files, customers_count, top_k_paths, max_workers, profile=False):
+    memo, lock = simulation_memo()
+    keys = [(config_hash(config_file), customers_count, top_k_paths, profile) for config_file in config_files]
+    with lock:
+        missing = [(config_file, key) for config_file, key in zip(config_files, keys) if key not in memo]
+    if missing:
+        simulations = simulate_many(
+            customers_count, [config_file for config_file, _ in missing],
+            max_workers=max_workers, top_k_paths=top_k_paths, profile=profile
+        )
+        with lock:
+            for (_, key), simulation in zip(missing, simulations):
+                memo[key] = simulation
+    with lock:
+        results = []
+        for key in keys:
+            memo.move_to_end(key)
+            results.append(memo[key])
+        while len(memo) > SIMULATION_CACHE_SIZE:
+            memo.popitem(last=False)
+    return results
+
+def display_single_configuration(config_name, results_df, summary_stats, config_file, path_metrics, customers_count, profiler=None):
     # Display configuration flow graph at the top
     st.header(f"Configuration Flow for {config_name}")
-    config_graph = create_config_graph(config_file)
-    st.graphviz_chart(config_graph)
+    with phase(profiler, 'config graph'):
+        display_config_graph(config_file, key=f"graph_{config_file}")
     
     # Display summary statistics
     st.subheader("Summary Statistics")
     st.markdown(summary_stats['text'])
+    if 'segments' in summary_stats:
+        st.markdown("#### Segments")
+        st.dataframe(summary_stats['segments'])
 
     # Generate pie chart
     st.markdown("#### Success vs Failure")
-    fig_pie = create_success_pie_chart(summary_stats['metrics'])
-    st.pyplot(fig_pie)
+    cache_key = (config_hash(config_file), customers_count)
+    with phase(profiler, 'pie chart'):
+        pie_chart = cached_success_pie_chart(cache_key, summary_stats['metrics'])
+        st.image(pie_chart)
 
     # Display detailed module results
     st.subheader("Detailed Module Results")
@@ -73,14 +164,27 @@ def display_single_configuration(config_name, results_df, summary_stats, config_
 
     # Generate and display visualizations
     st.subheader("Visualizations")
-    generate_visualizations(results_df, config_name)
+    with phase(profiler, 'visualizations'):
+        generate_visualizations(results_df, config_name, cache_key)
 
     # Display path analysis
     st.subheader("Path Analysis")
-    path_metrics_df = pd.DataFrame(path_metrics)
-    path_metrics_df['Total Time (minutes)'] = path_metrics_df['Total Time'] / 60
-    path_metrics_df['Expected Customers'] = path_metrics_df['Probability'] * customers_count
-    st.dataframe(path_metrics_df)
+    with phase(profiler, 'path analysis'):
+        display_expected_outcome(summary_stats['expected'], customers_count)
+        path_metrics_df = pd.DataFrame(path_metrics)
+        path_metrics_df['Total Time (minutes)'] = path_metrics_df['Total Time'] / 60
+        path_metrics_df['Expected Customers'] = path_metrics_df['Probability'] * customers_count
+        st.dataframe(path_metrics_df)
+
+    # Sensitivity of the funnel to each module's parameters
+    st.subheader("Sensitivity Analysis")
+    with st.expander("Which module parameters move the funnel most"):
+        st.markdown(
+            "Elasticity is the % change in the metric for a 1% change in the parameter, "
+            "computed in closed form from the module graph."
+        )
+        with phase(profiler, 'sensitivity'):
+            st.dataframe(cached_sensitivity_report(config_hash(config_file), config_file))
 
     # Identify the requested funnels (successful only)
     st.subheader("Funnel Insights")
@@ -131,6 +235,18 @@ def display_single_configuration(config_name, results_df, summary_stats, config_
     else:
         st.markdown("**No successful funnels found.**")
 
+def display_expected_outcome(expected, customers_count):
+    # Closed-form expectations from the absorbing Markov chain solver
+    st.markdown("#### Expected Outcome per Customer")
+    st.markdown(
+        f"- **Success Probability:** {expected['Success Probability']*100:.2f}%\n"
+        f"- **Failure Probability:** {(1 - expected['Success Probability'])*100:.2f}%\n"
+        f"- **Expected Successes:** {expected['Success Probability']*customers_count:.1f}\n"
+        f"- **Expected Cost per Customer:** ₹{expected['Expected Cost per Customer']:.2f}\n"
+        f"- **Expected Time per Customer:** {expected['Expected Time per Customer']/60:.2f} minutes\n"
+        f"- **Expected Latency per Customer:** {expected['Expected Latency per Customer']/60:.2f} minutes"
+    )
+
 def display_comparative_results(all_results, comparative_stats, selected_configs, customers_count):
     st.header("Comparative Analysis of Selected Configurations")
 
@@ -147,7 +263,8 @@ def display_comparative_results(all_results, comparative_stats, selected_configs
 
     # Generate comparative visualizations
     st.subheader("Comparative Visualizations")
-    generate_comparative_visualizations(comparison_df)
+    comparison_key = tuple((config_hash(config_file), customers_count) for config_file in selected_configs)
+    generate_comparative_visualizations(comparison_df, comparison_key)
 
     # Optionally, allow the user to view individual configuration details
     st.subheader("Individual Configuration Details")
@@ -155,14 +272,14 @@ def display_comparative_results(all_results, comparative_stats, selected_configs
         with st.expander(f"Details for {config_name}"):
             # Display the configuration graph
             st.markdown("#### Configuration Flow")
-            config_graph = create_config_graph(config_file)
-            st.graphviz_chart(config_graph)
+            display_config_graph(config_file, key=f"details_graph_{config_file}")
             st.markdown(summary_stats['text'])
             st.dataframe(results_df)
             # Generate visualizations for each configuration
-            generate_visualizations(results_df, config_name)
+            generate_visualizations(results_df, config_name, (config_hash(config_file), customers_count))
             # Display path analysis
             st.markdown("#### Path Analysis")
+            display_expected_outcome(summary_stats['expected'], customers_count)
             path_metrics_df = pd.DataFrame(path_metrics)
             path_metrics_df['Total Time (minutes)'] = path_metrics_df['Total Time'] / 60
             path_metrics_df['Expected Customers'] = path_metrics_df['Probability'] * customers_count
@@ -176,149 +293,140 @@ def display_comparative_results(all_results, comparative_stats, selected_configs
             else:
                 st.markdown("**No successful funnels found.**")
 
-def generate_visualizations(results_df, config_name):
+def generate_visualizations(results_df, config_name, cache_key):
+    figures = build_visualizations(cache_key, config_name, results_df)
+
     # Sankey Diagram
     st.markdown("#### Sankey Diagram")
-    fig_sankey = create_sankey_diagram(results_df, config_name)
-    st.plotly_chart(fig_sankey, use_container_width=True)
+    st.plotly_chart(figures['sankey'], use_container_width=True)
 
     # Time Distribution
     st.markdown("#### Time Distribution Across Modules")
-    fig_time = create_time_distribution_chart(results_df)
-    st.pyplot(fig_time)
+    st.image(figures['time'])
 
     # Cost Distribution
     st.markdown("#### Cost Distribution Across Modules")
-    fig_cost = create_cost_distribution_chart(results_df)
-    st.pyplot(fig_cost)
+    st.image(figures['cost'])
 
     # Success Distribution
     st.markdown("#### Success Distribution Across Modules")
-    fig_success = create_success_distribution_chart(results_df)
-    st.pyplot(fig_success)
+    st.image(figures['success'])
+
+# Figures are memoized per (config content hash, customers_count); the
+# underscore-prefixed arguments are not hashed by Streamlit. Charts are
+# kept as rendered PNG bytes, so no matplotlib figures stay alive.
+@st.cache_resource(max_entries=FIGURE_CACHE_SIZE)
+def build_visualizations(cache_key, config_name, _results_df):
+    return {
+        'sankey': create_sankey_diagram(_results_df, config_name),
+        'time': create_time_distribution_chart(_results_df),
+        'cost': create_cost_distribution_chart(_results_df),
+        'success': create_success_distribution_chart(_results_df),
+    }
+
+@st.cache_resource(max_entries=FIGURE_CACHE_SIZE)
+def cached_success_pie_chart(cache_key, _metrics):
+    return create_success_pie_chart(_metrics)
+
+@st.cache_resource(max_entries=FIGURE_CACHE_SIZE)
+def build_comparative_visualizations(comparison_key, _comparison_df):
+    return {
+        'success': create_comparative_bar_chart(
+            _comparison_df, 'Configuration', 'Success Rate', 'Success Rate (%)',
+            'Success Rate Comparison'
+        ),
+        'cost': create_comparative_bar_chart(
+            _comparison_df, 'Configuration', 'Total Cost', 'Total Cost (₹)',
+            'Total Cost Comparison'
+        ),
+        'time': create_comparative_bar_chart(
+            _comparison_df, 'Configuration', 'Total Time', 'Total Time (minutes)',
+            'Total Time Comparison'
+        ),
+    }
 
-def generate_comparative_visualizations(comparison_df):
+def generate_comparative_visualizations(comparison_df, comparison_key):
     # Convert percentage columns to numeric if needed
     comparison_df['Success Rate'] = comparison_df['Success Rate'].astype(float)
     comparison_df['Total Cost'] = comparison_df['Total Cost'].astype(float)
     comparison_df['Total Time'] = comparison_df['Total Time'].astype(float)
 
+    figures = build_comparative_visualizations(comparison_key, comparison_df)
+
     # Success Rate Comparison
-    fig_success = create_comparative_bar_chart(
-        comparison_df, 'Configuration', 'Success Rate', 'Success Rate (%)',
-        'Success Rate Comparison'
-    )
-    st.pyplot(fig_success)
+    st.image(figures['success'])
 
     # Total Cost Comparison
-    fig_cost = create_comparative_bar_chart(
-        comparison_df, 'Configuration', 'Total Cost', 'Total Cost (₹)',
-        'Total Cost Comparison'
-    )
-    st.pyplot(fig_cost)
+    st.image(figures['cost'])
 
     # Total Time Comparison
-    fig_time = create_comparative_bar_chart(
-        comparison_df, 'Configuration', 'Total Time', 'Total Time (minutes)',
-        'Total Time Comparison'
-    )
-    st.pyplot(fig_time)
+    st.image(figures['time'])
+
+def new_figure(figsize=None):
+    # Figures are created without pyplot, so there is no global figure
+    # registry to leak into; matplotlib is only imported on first use
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize)
+
+def render_png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+def style_bar_axes(ax, title, xlabel, ylabel):
+    # Light horizontal grid behind the bars, as in a whitegrid style
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_axisbelow(True)
+    ax.grid(axis='y', color='#dddddd')
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
 
 def create_success_pie_chart(metrics):
-    import matplotlib.pyplot as plt
-    fig, ax = plt.subplots()
+    fig = new_figure()
+    ax = fig.subplots()
     labels = ['Success', 'Failed']
     sizes = [metrics['Total Success'], metrics['Total Failures']]
     colors = ['green', 'red']
     ax.pie(sizes, labels=labels, colors=colors, autopct='%1.1f%%', startangle=90)
     ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-    return fig
+    return render_png(fig)
 
 def create_sankey_diagram(results_df, config_name):
     import plotly.graph_objects as go
 
-    # Prepare nodes and labels
-    modules = results_df['Module'].tolist()
-    labels = ['Start'] + modules + ['Success', 'Failed']
-    label_indices = {label: idx for idx, label in enumerate(labels)}
+    labels, links = sankey_data(results_df, max_modules=SANKEY_MAX_MODULES)
 
     # Define node colors
-    node_colors = []
     start_color = '#f2f2f2'  # Light gray for Start
     success_color = '#66cdaa'  # Soft green for Success
     failure_color = '#ff7f7f'  # Soft red for Failed
+    other_color = '#c0c0c0'  # Gray for collapsed low-volume modules
     mid_funnel_colors = [
         '#e6e6fa', '#d8bfd8', '#dda0dd', '#da70d6', '#ba55d3',
         '#9932cc', '#9400d3', '#8a2be2', '#9370db', '#7b68ee',
         '#6a5acd', '#483d8b', '#4169e1', '#3a5fcd', '#3333ff',
         '#1e90ff', '#00bfff', '#87cefa', '#add8e6', '#b0e0e6',
     ]  # Gradient blues for mid-funnel nodes
+    fixed_colors = {START: start_color, SUCCESS: success_color, FAILED: failure_color, OTHER: other_color}
+    node_colors = [
+        fixed_colors.get(label, mid_funnel_colors[(idx - 1) % len(mid_funnel_colors)])
+        for idx, label in enumerate(labels)
+    ]
 
-    mid_funnel_index = 0
-    for label in labels:
-        if label == 'Start':
-            node_colors.append(start_color)
-        elif label == 'Success':
-            node_colors.append(success_color)
-        elif label == 'Failed':
-            node_colors.append(failure_color)
-        else:
-            # Assign gradient colors to mid-funnel nodes
-            node_colors.append(mid_funnel_colors[mid_funnel_index % len(mid_funnel_colors)])
-            mid_funnel_index += 1
-
-    sources = []
-    targets = []
-    values = []
-    link_labels = []
-    link_colors = []
-
-    # Start node to first module
-    sources.append(label_indices['Start'])
-    targets.append(label_indices[modules[0]])
-    values.append(results_df.loc[0, 'Enter Funnel'])
-    link_labels.append(f"{results_df.loc[0, 'Enter Funnel']} customers")
-    link_colors.append('gray')  # Neutral color for links from Start node
-
-    # Iterate over modules
-    for idx, row in results_df.iterrows():
-        current_module = row['Module']
-        pass_count = row['Pass']
-        fail_count = row['Fail']
-        current_idx = label_indices[current_module]
-        enter_funnel = row['Enter Funnel']
-
-        # On success
-        if pass_count > 0:
-            next_module_name = row['Next Module on Success'] or 'Success'
-            if next_module_name == "Success":
-                target_idx = label_indices['Success']
-                link_color = 'rgba(102, 205, 170, 0.7)'  # Soft transparent green
-            else:
-                target_idx = label_indices.get(next_module_name, label_indices['Success'])
-                link_color = 'rgba(128, 128, 128, 0.5)'  # Transparent gray
-            sources.append(current_idx)
-            targets.append(target_idx)
-            values.append(pass_count)
-            percentage = (pass_count / enter_funnel) * 100
-            link_labels.append(f"{pass_count} ({percentage:.1f}%) passed")
-            link_colors.append(link_color)
-
-        # On failure
-        if fail_count > 0:
-            next_module_name = row['Next Module on Failure'] or 'Failed'
-            if next_module_name == "Failed":
-                target_idx = label_indices['Failed']
-                link_color = 'rgba(255, 127, 127, 0.7)'  # Soft transparent red
-            else:
-                target_idx = label_indices.get(next_module_name, label_indices['Failed'])
-                link_color = 'rgba(128, 128, 128, 0.5)'  # Transparent gray
-            sources.append(current_idx)
-            targets.append(target_idx)
-            values.append(fail_count)
-            percentage = (fail_count / enter_funnel) * 100
-            link_labels.append(f"{fail_count} ({percentage:.1f}%) failed")
-            link_colors.append(link_color)
+    # Green into Success, red into Failed, gray otherwise
+    link_colors = np.select(
+        [
+            (links['outcome'] == 'passed') & (links['target'] == labels.index(SUCCESS)),
+            (links['outcome'] == 'failed') & (links['target'] == labels.index(FAILED)),
+        ],
+        ['rgba(102, 205, 170, 0.7)', 'rgba(255, 127, 127, 0.7)'],
+        'rgba(128, 128, 128, 0.5)'
+    )
 
     # Create the Sankey diagram
     fig = go.Figure(data=[go.Sankey(
@@ -331,10 +439,10 @@ def create_sankey_diagram(results_df, config_name):
             color=node_colors
         ),
         link=dict(
-            source=sources,
-            target=targets,
-            value=values,
-            label=link_labels,
+            source=links['source'],
+            target=links['target'],
+            value=links['value'],
+            label=links['label'],
             color=link_colors
         ))])
 
@@ -342,104 +450,68 @@ def create_sankey_diagram(results_df, config_name):
     return fig
 
 def create_time_distribution_chart(results_df):
-    sns.set(style="whitegrid")
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.barplot(x='Module', y='Total Time', data=results_df, ax=ax, order=results_df['Module'])
-    ax.set_title('Time Distribution Across Modules')
-    ax.set_xlabel('Module')
-    ax.set_ylabel('Total Time (seconds)')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    return fig
+    fig = new_figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.bar(results_df['Module'], results_df['Total Time'], color=BAR_COLORS[0])
+    style_bar_axes(ax, 'Time Distribution Across Modules', 'Module', 'Total Time (seconds)')
+    fig.tight_layout()
+    return render_png(fig)
 
 def create_cost_distribution_chart(results_df):
-    sns.set(style="whitegrid")
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.barplot(x='Module', y='Total Cost', data=results_df, ax=ax, order=results_df['Module'])
-    ax.set_title('Cost Distribution Across Modules')
-    ax.set_xlabel('Module')
-    ax.set_ylabel('Total Cost (₹)')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    return fig
+    fig = new_figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.bar(results_df['Module'], results_df['Total Cost'], color=BAR_COLORS[0])
+    style_bar_axes(ax, 'Cost Distribution Across Modules', 'Module', 'Total Cost (₹)')
+    fig.tight_layout()
+    return render_png(fig)
 
 def create_success_distribution_chart(results_df):
-    sns.set(style="whitegrid")
-    success_df = results_df[['Module', 'Pass', 'Fail']].melt(id_vars='Module', var_name='Outcome', value_name='Count')
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.barplot(x='Module', y='Count', hue='Outcome', data=success_df, ax=ax, order=results_df['Module'])
-    ax.set_title('Success Distribution Across Modules')
-    ax.set_xlabel('Module')
-    ax.set_ylabel('Number of Customers')
-    plt.xticks(rotation=45)
-    plt.legend(title='Outcome')
-    plt.tight_layout()
-    return fig
+    fig = new_figure(figsize=(10, 6))
+    ax = fig.subplots()
+    positions = np.arange(len(results_df))
+    width = 0.4
+    ax.bar(positions - width / 2, results_df['Pass'], width, label='Pass', color=BAR_COLORS[0])
+    ax.bar(positions + width / 2, results_df['Fail'], width, label='Fail', color=BAR_COLORS[1])
+    ax.set_xticks(positions, results_df['Module'])
+    style_bar_axes(ax, 'Success Distribution Across Modules', 'Module', 'Number of Customers')
+    ax.legend(title='Outcome')
+    fig.tight_layout()
+    return render_png(fig)
 
 def create_comparative_bar_chart(df, x_col, y_col, y_label, title):
-    sns.set(style="whitegrid")
-    fig, ax = plt.subplots(figsize=(8, 6))
-    sns.barplot(x=x_col, y=y_col, data=df, ax=ax)
-    ax.set_title(title)
-    ax.set_xlabel('Configuration')
-    ax.set_ylabel(y_label)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    return fig
-
-def create_config_graph(config_file):
-    with open(config_file, 'r') as file:
-        config = yaml.safe_load(file)
-    
-    modules = config['modules']
-    module_dict = {module['name']: module for module in modules}
-    is_start_modules = [module['name'] for module in modules if module.get('is_start', False)]
-    
-    # Start building the DOT graph description
-    graph_lines = ['digraph G {']
-    graph_lines.append('rankdir=LR;')  # Left to right orientation
-    graph_lines.append('node [shape=box, style=filled, color="#EEEEEE"];')
-    
-    # Define nodes
-    for module in modules:
-        node_label = module['name']
-        graph_lines.append(f'"{module["name"]}" [label="{node_label}"];')
-    
-    # Define edges
-    for module in modules:
-        current_module = module['name']
-        if 'next_module_on_success' in module and module['next_module_on_success']:
-            next_module = module['next_module_on_success']
-            if next_module != "Success":
-                graph_lines.append(f'"{current_module}" -> "{next_module}" [label="Success", color="green"];')
-            else:
-                graph_lines.append(f'"{current_module}" -> "Success" [label="Success", color="green"];')
-        if 'next_module_on_failure' in module and module['next_module_on_failure']:
-            next_module = module['next_module_on_failure']
-            if next_module != "Failed":
-                graph_lines.append(f'"{current_module}" -> "{next_module}" [label="Failure", color="red"];')
-            else:
-                graph_lines.append(f'"{current_module}" -> "Failed" [label="Failure", color="red"];')
-    
-    # Add Success and Failed nodes if they are used
-    success_used = any(module.get('next_module_on_success') == "Success" for module in modules)
-    failed_used = any(
-        module.get('next_module_on_failure') == "Failed"
-        for module in modules
-    )
-    if success_used:
-        graph_lines.append('"Success" [shape=doublecircle, style=filled, color="green"];')
-    if failed_used:
-        graph_lines.append('"Failed" [shape=doublecircle, style=filled, color="red"];')
-    
-    # Start node(s)
-    for start_module in is_start_modules:
-        graph_lines.append(f'Start -> "{start_module}";')
-    graph_lines.append('Start [shape=Mdiamond];')
-    
-    graph_lines.append('}')
-    dot_graph = '\n'.join(graph_lines)
-    return dot_graph
+    fig = new_figure(figsize=(8, 6))
+    ax = fig.subplots()
+    ax.bar(df[x_col], df[y_col], color=BAR_COLORS)
+    style_bar_axes(ax, title, 'Configuration', y_label)
+    fig.tight_layout()
+    return render_png(fig)
+
+# The sensitivity report only depends on the config, so it is memoized per
+# config content hash
+@st.cache_data(max_entries=FIGURE_CACHE_SIZE)
+def cached_sensitivity_report(config_key, config_file):
+    return load_funnel(config_file).sensitivity_report()
+
+def create_config_graph(config_file, focus=None, radius=2):
+    # Built from the cached compiled funnel rather than the raw config
+    return funnel_dot(load_funnel(config_file).compiled, focus, radius)
+
+# DOT source is memoized per (config content hash, focus, radius)
+@st.cache_data(max_entries=FIGURE_CACHE_SIZE)
+def cached_config_graph(graph_key, config_file, focus=None, radius=2):
+    return create_config_graph(config_file, focus, radius)
+
+def display_config_graph(config_file, key):
+    # Large funnels show the neighborhood of one module at a time
+    focus, radius = None, 2
+    compiled = load_funnel(config_file).compiled
+    if len(compiled) > GRAPH_MAX_MODULES:
+        columns = st.columns(2)
+        focus = columns[0].selectbox(
+            "Focus Module", compiled.names, index=compiled.start, key=f"{key}_focus"
+        )
+        radius = columns[1].slider("Neighborhood Radius", min_value=1, max_value=10, value=2, key=f"{key}_radius")
+    st.graphviz_chart(cached_config_graph(config_hash(config_file), config_file, focus, radius))
 
 if __name__ == "__main__":
     main()
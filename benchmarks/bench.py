@@ -0,0 +1,153 @@
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from funnel import Funnel
+from generators import SHAPES, write_config
+
+# Measures wall time and peak traced memory of the core Funnel operations on
+# synthetic funnels, and compares them with a stored baseline:
+#
+#   python benchmarks/bench.py                 # report
+#   python benchmarks/bench.py --save          # record benchmarks/baseline.json
+#   python benchmarks/bench.py --check         # exit 1 on regressions
+#
+# Timings are machine-specific; record the baseline on the machine that
+# runs the checks.
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+CUSTOMERS = 100000
+# Path operations are skipped when enumeration would visit more than this
+# many (module, outcome) steps in total
+PATH_WORK_LIMIT = 2000000
+
+def _path_work(funnel):
+    # Total length of all simple paths, or None once it exceeds the limit
+    work = 0
+    for path in funnel.iter_paths():
+        work += len(path)
+        if work > PATH_WORK_LIMIT:
+            return None
+    return work
+
+def _run_funnel(funnel):
+    # Drop the traced result of the previous run so every repetition
+    # propagates from scratch instead of reusing it
+    funnel._last_run = None
+    return funnel.run_funnel(CUSTOMERS, verbose=False)
+
+# name -> (operation, precondition on the built funnel)
+OPERATIONS = {
+    'build': (None, None),
+    'run_funnel': (_run_funnel, None),
+    'get_all_paths': (lambda funnel: funnel.get_all_paths(), _path_work),
+    'compute_path_metrics': (lambda funnel: funnel.compute_path_metrics(), _path_work),
+    'top_k_paths': (lambda funnel: funnel.top_k_paths(1000), None),
+    'absorption_metrics': (lambda funnel: funnel.absorption_metrics(), None),
+}
+
+def measure(operation, repeat):
+    # Best-of-`repeat` wall time, then one extra run under tracemalloc
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        operation()
+        best = min(best, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 2 ** 20
+
+def run_benchmarks(shapes, sizes, operations, repeat=3):
+    results = {}
+    for shape, size in itertools.product(shapes, sizes):
+        config = SHAPES[shape](size)
+        for name in operations:
+            operation, precondition = OPERATIONS[name]
+            key = f"{shape}/{size}/{name}"
+            if operation is None:
+                seconds, peak_mb = measure(lambda: Funnel(None, config=config), repeat)
+            else:
+                funnel = Funnel(None, config=config)
+                if precondition is not None and not precondition(funnel):
+                    print(f"{key:45s} skipped", flush=True)
+                    continue
+                seconds, peak_mb = measure(lambda: operation(funnel), repeat)
+            results[key] = {'seconds': seconds, 'peak_mb': peak_mb}
+            print(f"{key:45s} {seconds * 1000:10.2f} ms {peak_mb:10.2f} MB", flush=True)
+    return results
+
+def compare(results, baseline, tolerance, min_seconds):
+    # A regression is slower by more than `tolerance` (and by at least
+    # min_seconds, to ignore timer noise on tiny cases) or uses more
+    # than `tolerance` extra peak memory
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        slower = current['seconds'] - previous['seconds']
+        if slower > min_seconds and current['seconds'] > previous['seconds'] * (1 + tolerance):
+            regressions.append(f"{key}: {previous['seconds'] * 1000:.2f} ms -> {current['seconds'] * 1000:.2f} ms")
+        if current['peak_mb'] > previous['peak_mb'] * (1 + tolerance) + 0.1:
+            regressions.append(f"{key}: {previous['peak_mb']:.2f} MB -> {current['peak_mb']:.2f} MB")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the funnel engine on synthetic funnels.")
+    parser.add_argument('--shapes', nargs='+', choices=list(SHAPES), default=list(SHAPES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES)
+    parser.add_argument('--operations', nargs='+', choices=list(OPERATIONS), default=list(OPERATIONS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true', help="Write the results as the new baseline")
+    parser.add_argument('--check', action='store_true', help="Exit 1 if any result regresses against the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="Allowed relative slowdown (default 0.5)")
+    parser.add_argument('--min-seconds', type=float, default=0.005, help="Ignore slowdowns smaller than this")
+    parser.add_argument('--write-configs', metavar='DIR', help="Also write the generated configs as YAML")
+    args = parser.parse_args(argv)
+
+    if args.write_configs:
+        os.makedirs(args.write_configs, exist_ok=True)
+        for shape, size in itertools.product(args.shapes, args.sizes):
+            write_config(SHAPES[shape](size), os.path.join(args.write_configs, f"{shape}_{size}.yaml"))
+
+    results = run_benchmarks(args.shapes, args.sizes, args.operations, args.repeat)
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump({
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'results': results,
+            }, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f"Baseline written to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
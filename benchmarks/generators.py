@@ -0,0 +1,58 @@
+import numpy as np
+import yaml
+
+# Synthetic funnel configs of controlled size and shape for benchmarking.
+# Rates stay high so customers reach deep modules in long funnels.
+
+def _module(idx, rng, on_success, on_failure):
+    return {
+        'name': f"M{idx}",
+        'is_start': idx == 0,
+        'success_rate': round(float(rng.uniform(0.95, 0.999)), 3),
+        'cost_per_transaction': round(float(rng.uniform(0.5, 10)), 2),
+        'time_to_complete': int(rng.integers(5, 120)),
+        'next_module_on_success': on_success,
+        'next_module_on_failure': on_failure,
+    }
+
+def linear_config(n, seed=0):
+    # A single chain: pass to the next module, fail out of the funnel
+    rng = np.random.default_rng(seed)
+    return {'modules': [
+        _module(i, rng, f"M{i + 1}" if i + 1 < n else "Success", "Failed")
+        for i in range(n)
+    ]}
+
+def branching_config(n, width=4, seed=0):
+    # Half of the modules send failures to a fallback among the next
+    # `width` modules instead of out of the funnel, so the number of
+    # distinct paths grows exponentially
+    rng = np.random.default_rng(seed)
+    modules = []
+    for i in range(n):
+        on_success = f"M{i + 1}" if i + 1 < n else "Success"
+        fallback = i + 1 + int(rng.integers(1, width + 1))
+        on_failure = f"M{fallback}" if fallback < n and rng.random() < 0.5 else "Failed"
+        modules.append(_module(i, rng, on_success, on_failure))
+    return {'modules': modules}
+
+def retry_config(n, every=3, seed=0):
+    # A chain where every `every`-th module sends failures back to the
+    # previous module for a retry, creating cycles
+    rng = np.random.default_rng(seed)
+    modules = []
+    for i in range(n):
+        on_success = f"M{i + 1}" if i + 1 < n else "Success"
+        on_failure = f"M{i - 1}" if i > 0 and i % every == 0 else "Failed"
+        modules.append(_module(i, rng, on_success, on_failure))
+    return {'modules': modules}
+
+SHAPES = {
+    'linear': linear_config,
+    'branching': branching_config,
+    'retry': retry_config,
+}
+
+def write_config(config, path):
+    with open(path, 'w') as file:
+        yaml.safe_dump(config, file, sort_keys=False)
@@ -0,0 +1,69 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Measures how long the core modules take to import in a fresh interpreter
+# and checks that they do not pull in heavy optional packages, which are
+# imported only when a DataFrame, YAML config or chart is needed:
+#
+#   python benchmarks/import_time.py            # report
+#   python benchmarks/import_time.py --check    # exit 1 if a heavy package loads
+#                                               # or an import is over budget
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORE_MODULES = ['engine', 'markov', 'modules', 'loader', 'funnel', 'cache', 'simulator', 'cli', 'optimizer']
+HEAVY_PACKAGES = ['pandas', 'yaml', 'matplotlib', 'seaborn', 'plotly', 'streamlit']
+# Startup budget per module in seconds, NumPy included
+DEFAULT_BUDGET = 0.5
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(seconds, ','.join(heavy))
+"""
+
+def measure(module, repeat=3):
+    # Best-of-`repeat` import time, each in a new process so nothing is
+    # already cached in sys.modules; also returns the heavy packages loaded
+    best, heavy = float('inf'), []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_PACKAGES)],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.split()
+        best = min(best, float(output[0]))
+        heavy = output[1].split(',') if len(output) > 1 else []
+    return best, heavy
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark import time of the core modules.")
+    parser.add_argument('--modules', nargs='+', default=CORE_MODULES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help="Allowed seconds per module")
+    parser.add_argument('--check', action='store_true', help="Exit 1 on heavy imports or budget overruns")
+    args = parser.parse_args(argv)
+
+    problems = []
+    for module in args.modules:
+        seconds, heavy = measure(module, args.repeat)
+        print(f"{module:15s} {seconds * 1000:10.2f} ms   {', '.join(heavy) or '-'}", flush=True)
+        if heavy:
+            problems.append(f"{module} imports {', '.join(heavy)}")
+        if seconds > args.budget:
+            problems.append(f"{module} takes {seconds * 1000:.0f} ms to import")
+
+    if args.check:
+        if problems:
+            print("Import problems:")
+            for problem in problems:
+                print(f"  {problem}")
+            return 1
+        print("No import problems.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from funnel import Funnel
+from loader import parse_config
+from profiling import phase
+
+# Bump when the pickled Funnel layout changes so stale disk entries are ignored
+CACHE_VERSION = 3
+
+def config_hash(config_path):
+    with open(config_path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+class FunnelCache:
+    # Compiled funnels keyed by the SHA-256 of the config file's content, so
+    # editing the YAML invalidates the entry automatically. Entries live in
+    # an in-process LRU and, when cache_dir is set, as pickles on disk.
+    def __init__(self, maxsize=32, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+
+    def get(self, config_path, profiler=None):
+        with phase(profiler, 'read config'):
+            with open(config_path, 'rb') as file:
+                content = file.read()
+            key = hashlib.sha256(content).hexdigest()
+
+        funnel = self._entries.get(key)
+        if funnel is not None:
+            self._entries.move_to_end(key)
+        else:
+            funnel = self._load_from_disk(key)
+            if funnel is None:
+                with phase(profiler, 'parse config'):
+                    config = parse_config(content, config_path)
+                funnel = Funnel(config_path, config=config, profiler=profiler)
+                self._save_to_disk(key, funnel)
+            self._entries[key] = funnel
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        funnel.config_path = config_path
+        return funnel
+
+    def clear(self):
+        self._entries.clear()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"funnel-v{CACHE_VERSION}-{key}.pickle")
+
+    def _load_from_disk(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as file:
+                return pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    def _save_to_disk(self, key, funnel):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._disk_path(key)
+        # Write to a temporary file first so concurrent readers never see a partial pickle
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(funnel, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+_default_cache = FunnelCache(
+    maxsize=int(os.environ.get('FUNNEL_CACHE_SIZE', 32)),
+    cache_dir=os.environ.get('FUNNEL_CACHE_DIR') or None
+)
+
+def load_funnel(config_path, profiler=None):
+    return _default_cache.get(config_path, profiler)
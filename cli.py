@@ -0,0 +1,116 @@
+import argparse
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from cache import load_funnel
+from replay import require_parquet
+
+# Headless batch runner: every config is run at every customer count, and
+# the summary metrics (and optionally the per-module results) are written
+# as CSV, Parquet or JSON, e.g. for nightly capacity sweeps:
+#
+#   python cli.py configs/*.yaml --customers 1000 10000 100000 \
+#       --output sweep.parquet --modules-output modules.parquet --workers 4
+
+FORMATS = ('csv', 'parquet', 'json')
+
+def run_job(config_path, customers_count, include_modules=False, fractional=False):
+    funnel = load_funnel(config_path)
+    results, summary_stats = funnel.run_funnel(customers_count, verbose=False, fractional=fractional)
+    config_name = os.path.splitext(os.path.basename(config_path))[0]
+    summary = {'Configuration': config_name, 'Customers': customers_count, **summary_stats['metrics']}
+    if not include_modules:
+        return summary, None
+    results.insert(0, 'Customers', customers_count)
+    results.insert(0, 'Configuration', config_name)
+    return summary, results
+
+def run_sweep(config_paths, customers_counts, workers=None, include_modules=False, fractional=False):
+    # One job per (config, customers_count) pair, fanned out over processes;
+    # rows come back in config order, then customer count order.
+    import pandas as pd
+    jobs = list(itertools.product(config_paths, customers_counts))
+    if workers == 1 or len(jobs) <= 1:
+        outputs = [run_job(config_path, count, include_modules, fractional) for config_path, count in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(
+                run_job,
+                [config_path for config_path, _ in jobs],
+                [count for _, count in jobs],
+                [include_modules] * len(jobs),
+                [fractional] * len(jobs),
+                chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))
+            ))
+    summary = pd.DataFrame([summary for summary, _ in outputs])
+    modules = pd.concat([results for _, results in outputs], ignore_index=True) if include_modules else None
+    return summary, modules
+
+def output_format(path, fmt):
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    return extension if extension in FORMATS else 'csv'
+
+def check_output(path, fmt):
+    # Checked before the sweep runs, so a bad output fails fast.
+    # "-" writes to stdout; Parquet needs a real file and an engine.
+    if fmt == 'parquet':
+        if path == '-':
+            raise ValueError("Parquet output needs a file path")
+        require_parquet()
+
+def write_frame(frame, path, fmt):
+    if fmt == 'parquet':
+        frame.to_parquet(path, index=False)
+    elif fmt == 'json':
+        frame.to_json(sys.stdout if path == '-' else path, orient='records', indent=2, force_ascii=False)
+        if path == '-':
+            sys.stdout.write('\n')
+    else:
+        frame.to_csv(sys.stdout if path == '-' else path, index=False)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run funnel simulations without the dashboard.")
+    parser.add_argument('configs', nargs='+', help="YAML configuration files")
+    parser.add_argument('-n', '--customers', nargs='+', type=int, default=[100],
+                        help="Customer counts to simulate (default: 100)")
+    parser.add_argument('-o', '--output', default='-',
+                        help="Summary output file; format follows the extension (default: CSV on stdout)")
+    parser.add_argument('--modules-output', help="Also write per-module results to this file")
+    parser.add_argument('-f', '--format', choices=FORMATS, help="Override the output format")
+    parser.add_argument('--fractional', action='store_true',
+                        help="Propagate expected counts and round only in the output")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="Worker processes (default: one per CPU; 1 runs serially)")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if any(count <= 0 for count in args.customers):
+        parser.error("customer counts must be positive")
+    if args.workers is not None and args.workers <= 0:
+        parser.error("--workers must be positive")
+
+    outputs = [(args.output, output_format(args.output, args.format))]
+    if args.modules_output:
+        outputs.append((args.modules_output, output_format(args.modules_output, args.format)))
+    try:
+        for path, fmt in outputs:
+            check_output(path, fmt)
+        summary, modules = run_sweep(
+            args.configs, args.customers, workers=args.workers,
+            include_modules=bool(args.modules_output), fractional=args.fractional
+        )
+        write_frame(summary, *outputs[0])
+        if args.modules_output:
+            write_frame(modules, *outputs[1])
+    except (OSError, ValueError, KeyError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,8 @@
 import streamlit as st
 import yaml
+import copy
+from funnel import Funnel
+from loader import ConfigError
 
 def main():
     st.title("Funnel Configuration Builder")
@@ -68,9 +71,13 @@ def main():
 
             # Display funnel visualization
             st.subheader("Funnel Visualization")
-            config_graph = create_config_graph(st.session_state.modules)
+            config_graph = cached_config_graph(yaml_str, st.session_state.modules)
             st.graphviz_chart(config_graph)
 
+            # What-if preview of the funnel's results
+            st.subheader("What-If Preview")
+            display_what_if(config_data, yaml_str)
+
             # Option to download YAML file
             st.subheader("Download Configuration")
             yaml_bytes = yaml_str.encode('utf-8')
@@ -169,6 +176,38 @@ def display_module_form(module_id, module):
 
             return True  # If neither submit nor delete was pressed
 
+def display_what_if(config_data, yaml_str):
+    # Keep one Funnel per configuration and apply slider edits to it in
+    # place, so each change only recomputes the part of the funnel
+    # downstream of the edited module instead of rebuilding it
+    if st.session_state.get('what_if_config') != yaml_str:
+        modules = [copy.deepcopy(m) for m in config_data['modules'] if m['name'] != '']
+        try:
+            st.session_state.what_if_funnel = Funnel(None, config={'modules': modules})
+            st.session_state.what_if_errors = []
+        except ConfigError as e:
+            st.session_state.what_if_funnel = None
+            st.session_state.what_if_errors = e.errors
+        st.session_state.what_if_config = yaml_str
+
+    funnel = st.session_state.what_if_funnel
+    if funnel is None:
+        st.info("Fix the configuration to preview results:\n" + "\n".join(
+            f"- {error}" for error in st.session_state.what_if_errors
+        ))
+        return
+
+    customers_count = st.number_input("Number of Customers", min_value=1, value=100, step=1, key='what_if_customers')
+    module_name = st.selectbox("Module", list(funnel.modules), key='what_if_module')
+    success_rate = st.slider(
+        "Success Rate", min_value=0.0, max_value=1.0,
+        value=float(funnel.modules[module_name].success_rate), step=0.01,
+        key=f"what_if_rate_{module_name}"
+    )
+    funnel.update_module(module_name, success_rate=success_rate)
+    _, summary_stats = funnel.run_funnel(int(customers_count), verbose=False)
+    st.markdown(summary_stats['text'])
+
 def delete_module(module_id):
     module_name = st.session_state.modules[module_id]['name']
     del st.session_state.modules[module_id]
@@ -182,6 +221,11 @@ def delete_module(module_id):
         if mod['next_module_on_failure'] == module_name:
             mod['next_module_on_failure'] = ''
 
+# The YAML text stands in for the modules, which Streamlit does not hash
+@st.cache_data(max_entries=32)
+def cached_config_graph(yaml_str, _modules_dict):
+    return create_config_graph(_modules_dict)
+
 def create_config_graph(modules_dict):
     modules = modules_dict.values()
     graph_lines = ['digraph G {']
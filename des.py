@@ -0,0 +1,195 @@
+import heapq
+import itertools
+from collections import deque
+import numpy as np
+from engine import SUCCESS
+
+# Discrete-event simulation of the funnel with finite worker capacity.
+# Customers arrive as a Poisson process; every module is a FCFS queue with
+# `capacity` workers (0 = unlimited) and a deterministic service time of
+# time_to_complete seconds. Each customer passes a module independently with
+# probability success_rate and is routed along the matching edge.
+
+def simulate_queueing(compiled, customers_count, arrival_rate, seed=None):
+    if not arrival_rate or arrival_rate <= 0:
+        raise ValueError("arrival_rate must be a positive number of customers per second")
+    rng = np.random.default_rng(seed)
+    arrivals = np.cumsum(rng.exponential(1.0 / arrival_rate, customers_count))
+    if compiled.topological_order() is not None:
+        records, exits = _simulate_acyclic(compiled, arrivals, rng)
+    else:
+        records, exits = _simulate_events(compiled, arrivals, rng)
+    return _report(compiled, records, exits, customers_count)
+
+def _fcfs_start_times(enter, service_time, capacity):
+    # With identical service times, customers start and finish in arrival
+    # order, so customer i takes the worker freed by customer i - capacity.
+    # Each residue class mod capacity then follows the Lindley recursion
+    # start_k = max(enter_k, start_{k-1} + s) = k*s + max_{j<=k}(enter_j - j*s),
+    # which is a cumulative maximum.
+    if capacity <= 0 or capacity >= enter.size:
+        return enter.copy()
+    start = np.empty_like(enter)
+    for offset in range(capacity):
+        lane = enter[offset::capacity]
+        shift = np.arange(lane.size) * service_time
+        start[offset::capacity] = np.maximum.accumulate(lane - shift) + shift
+    return start
+
+def _simulate_acyclic(compiled, arrivals, rng):
+    # Acyclic funnels: handle whole modules at a time in topological order,
+    # once every upstream module has delivered its customers.
+    n = len(compiled)
+    inflow = [[] for _ in range(n)]  # (module arrival times, funnel arrival times) chunks
+    inflow[compiled.start].append((arrivals, arrivals))
+    records = [None] * n
+    exits = []
+    for idx in compiled.topological_order().tolist():
+        if not inflow[idx]:
+            continue
+        enter = np.concatenate([chunk[0] for chunk in inflow[idx]])
+        origin = np.concatenate([chunk[1] for chunk in inflow[idx]])
+        inflow[idx] = None
+        by_arrival = np.argsort(enter, kind='stable')
+        enter, origin = enter[by_arrival], origin[by_arrival]
+
+        start = _fcfs_start_times(enter, compiled.time[idx], compiled.capacity[idx])
+        finish = start + compiled.time[idx]
+        records[idx] = (enter, start)
+
+        passed = rng.random(enter.size) < compiled.success_rate[idx]
+        for mask, target in ((passed, compiled.next_on_success[idx]), (~passed, compiled.next_on_failure[idx])):
+            if target >= 0:
+                inflow[target].append((finish[mask], origin[mask]))
+            else:
+                exits.append((origin[mask], finish[mask], np.full(mask.sum(), target)))
+    return records, exits
+
+def _simulate_events(compiled, arrivals, rng, chunk_size=65536):
+    # General event-driven simulation with a heap of pending events; used
+    # when the funnel has retry loops and no topological order exists.
+    n = len(compiled)
+    rates = compiled.success_rate.tolist()
+    times = compiled.time.tolist()
+    capacity = compiled.capacity.tolist()
+    on_success = compiled.next_on_success.tolist()
+    on_failure = compiled.next_on_failure.tolist()
+
+    busy = [0] * n
+    waiting = [deque() for _ in range(n)]
+    enter_log = [[] for _ in range(n)]
+    start_log = [[] for _ in range(n)]
+    exit_origin, exit_time, exit_code = [], [], []
+
+    # Event tuples: (time, sequence, module, module arrival time, funnel arrival time);
+    # module == -1 marks an external arrival at the start module.
+    sequence = itertools.count()
+    events = [(float(arrivals[0]), next(sequence), -1, 0.0, 0.0)] if arrivals.size else []
+    next_arrival = 1
+    uniforms = rng.random(chunk_size).tolist()
+    draw = 0
+
+    def begin_service(module, enter, now, origin):
+        enter_log[module].append(enter)
+        start_log[module].append(now)
+        heapq.heappush(events, (now + times[module], next(sequence), module, enter, origin))
+
+    def arrive(module, now, origin):
+        if capacity[module] == 0 or busy[module] < capacity[module]:
+            busy[module] += 1
+            begin_service(module, now, now, origin)
+        else:
+            waiting[module].append((now, origin))
+
+    while events:
+        now, _, module, enter, origin = heapq.heappop(events)
+        if module == -1:
+            arrive(compiled.start, now, now)
+            if next_arrival < arrivals.size:
+                heapq.heappush(events, (float(arrivals[next_arrival]), next(sequence), -1, 0.0, 0.0))
+                next_arrival += 1
+            continue
+
+        # Service finished: route the customer, then pull the next in line
+        if draw == len(uniforms):
+            uniforms = rng.random(chunk_size).tolist()
+            draw = 0
+        target = on_success[module] if uniforms[draw] < rates[module] else on_failure[module]
+        draw += 1
+        if target >= 0:
+            arrive(target, now, origin)
+        else:
+            exit_origin.append(origin)
+            exit_time.append(now)
+            exit_code.append(target)
+
+        if waiting[module]:
+            queued_enter, queued_origin = waiting[module].popleft()
+            begin_service(module, queued_enter, now, queued_origin)
+        else:
+            busy[module] -= 1
+
+    records = [
+        (np.array(enter_log[idx]), np.array(start_log[idx])) if enter_log[idx] else None
+        for idx in range(n)
+    ]
+    exits = [(np.array(exit_origin), np.array(exit_time), np.array(exit_code, dtype=np.int64))]
+    return records, exits
+
+def _report(compiled, records, exits, customers_count):
+    import pandas as pd
+    exit_origin = np.concatenate([chunk[0] for chunk in exits]) if exits else np.zeros(0)
+    exit_time = np.concatenate([chunk[1] for chunk in exits]) if exits else np.zeros(0)
+    exit_code = np.concatenate([chunk[2] for chunk in exits]) if exits else np.zeros(0, dtype=np.int64)
+    makespan = float(exit_time.max()) if exit_time.size else 0.0
+    percentiles = [50, 95, 99]
+
+    rows = []
+    for idx, record in enumerate(records):
+        if record is None:
+            continue
+        enter, start = record
+        service_time = compiled.time[idx]
+        capacity = int(compiled.capacity[idx])
+        wait = start - enter
+        latency = wait + service_time
+
+        # Queue length seen just after each arrival: arrived so far minus started so far
+        arrived_sorted = np.sort(enter)
+        started_sorted = np.sort(start)
+        queue_length = (
+            np.searchsorted(arrived_sorted, arrived_sorted, side='right')
+            - np.searchsorted(started_sorted, arrived_sorted, side='right')
+        )
+        busy_workers = enter.size * service_time / makespan if makespan else 0.0
+        p50, p95, p99 = np.percentile(latency, percentiles)
+        rows.append({
+            "Module": compiled.names[idx],
+            "Capacity": capacity if capacity else None,
+            "Arrivals": enter.size,
+            "Avg Busy Workers": busy_workers,
+            "Utilization": busy_workers / capacity if capacity else np.nan,
+            "Avg Queue Length": wait.sum() / makespan if makespan else 0.0,  # Little's law
+            "Max Queue Length": int(queue_length.max()),
+            "Avg Wait": wait.mean(),
+            "p50 Latency": p50,
+            "p95 Latency": p95,
+            "p99 Latency": p99,
+        })
+    module_stats = pd.DataFrame(rows)
+
+    end_to_end = exit_time - exit_origin
+    total_success = int((exit_code == SUCCESS).sum())
+    e2e = np.percentile(end_to_end, percentiles) if end_to_end.size else [np.nan] * 3
+    summary = {
+        'Customers': customers_count,
+        'Total Success': total_success,
+        'Total Failures': customers_count - total_success,
+        'Makespan': makespan,
+        'Throughput per Hour': customers_count / makespan * 3600 if makespan else np.nan,
+        'Mean Latency': float(end_to_end.mean()) if end_to_end.size else np.nan,
+        'p50 Latency': float(e2e[0]),
+        'p95 Latency': float(e2e[1]),
+        'p99 Latency': float(e2e[2]),
+    }
+    return module_stats, summary
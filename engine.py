@@ -0,0 +1,419 @@
+import numpy as np
+import warnings
+
+# Successor codes for edges that leave the module graph
+SUCCESS = -1
+FAILED = -2
+DROPPED = -3  # Missing or unknown next module: customers leave the funnel
+# Smallest expected flow followed in fractional propagation, in customers
+FLOW_EPSILON = 1e-9
+# Default level limit for funnels with loops in fractional and binomial
+# runs, whose flows only die out gradually: this many levels per module,
+# and at least MIN_STEP_LIMIT
+STEPS_PER_MODULE = 10
+MIN_STEP_LIMIT = 10000
+
+class CompiledFunnel:
+    def __init__(self, modules, start_module):
+        # modules: dict of name -> Module, in config order
+        self.names = list(modules.keys())
+        self.index = {name: idx for idx, name in enumerate(self.names)}
+        module_list = list(modules.values())
+
+        self.success_rate = np.array([m.success_rate for m in module_list], dtype=float)
+        self.cost = np.array([m.cost_per_transaction for m in module_list], dtype=float)
+        self.time = np.array([m.time_to_complete for m in module_list], dtype=float)
+        # Raw edge labels, kept for the results table
+        self.success_labels = [m.next_module_on_success for m in module_list]
+        self.failure_labels = [m.next_module_on_failure for m in module_list]
+        self.next_on_success = self._resolve(self.success_labels, "Success", SUCCESS)
+        self.next_on_failure = self._resolve(self.failure_labels, "Failed", FAILED)
+        self.start = self.index[start_module.name]
+
+        # Worker capacity per module; 0 means unlimited
+        self.capacity = np.array([m.capacity or 0 for m in module_list], dtype=np.int64)
+        self.is_parallel = np.array([bool(m.is_parallel) for m in module_list], dtype=bool)
+        self.parallel_groups = self._parallel_groups()
+        self.wall_time = self.critical_path_times(self.time)
+
+    def _parallel_groups(self):
+        # A parallel group is a chain of is_parallel modules linked by success
+        # edges: they are launched together, so customers who pass the whole
+        # chain wait for its slowest member rather than the sum of all.
+        n = len(self.names)
+        successor = np.where(self.next_on_success >= 0, self.next_on_success, n)
+        parallel_next = np.append(self.is_parallel, False)[successor] & self.is_parallel
+        has_parallel_predecessor = np.zeros(n, dtype=bool)
+        has_parallel_predecessor[successor[parallel_next]] = True
+
+        groups = []
+        grouped = np.zeros(n, dtype=bool)
+        # Heads first; any parallel modules left over sit on a pure cycle
+        heads = np.flatnonzero(self.is_parallel & ~has_parallel_predecessor).tolist()
+        heads += np.flatnonzero(self.is_parallel & has_parallel_predecessor).tolist()
+        for head in heads:
+            if grouped[head]:
+                continue
+            chain = [head]
+            grouped[head] = True
+            while parallel_next[chain[-1]] and not grouped[successor[chain[-1]]]:
+                chain.append(int(successor[chain[-1]]))
+                grouped[chain[-1]] = True
+            groups.append(np.array(chain, dtype=np.int64))
+        return groups
+
+    def critical_path_times(self, time):
+        # Wall-clock time charged per customer entering each module. Within a
+        # parallel group, member k adds only how much it extends the running
+        # maximum of the members before it, so passing the whole group costs
+        # max(times) instead of sum(times). Accepts (modules,) or
+        # (scenarios, modules) arrays.
+        wall_time = np.array(time, dtype=float)
+        for chain in self.parallel_groups:
+            running_max = np.maximum.accumulate(wall_time[..., chain], axis=-1)
+            wall_time[..., chain[1:]] = np.diff(running_max, axis=-1)
+        return wall_time
+
+    def _resolve(self, targets, terminal_name, terminal_code):
+        # Successor codes for a list of edge labels; missing and unknown
+        # targets are DROPPED
+        lookup = dict(self.index)
+        lookup[terminal_name] = terminal_code
+        return np.array([lookup.get(target, DROPPED) for target in targets], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def propagate(self, customers_count, success_rate=None, rng=None, max_steps=None, trace=None, fractional=False,
+                  pool=False):
+        # Level-synchronous propagation: every module reached at the same
+        # depth is processed in one vectorized step, in BFS order.
+        # customers_count may be a scalar or a 1-D array of scenarios, in
+        # which case success_rate may hold one row of rates per scenario.
+        # With a NumPy Generator as `rng`, pass counts are drawn binomially
+        # instead of rounded. With fractional=True, expected counts flow as
+        # floats and nothing is rounded. With pool=True, whole customers
+        # reaching a module at the same level through different branches are
+        # rounded together rather than per branch (see _step). Funnels with
+        # loops raise ValueError after max_steps levels (see _step_limit for
+        # the default). If `trace` is a list, each level's (frontier, counts,
+        # visits, pass counts) is appended to it for repropagate().
+        batched = np.ndim(customers_count) > 0
+        # Work module-major (one row per module, one column per scenario)
+        # so each level touches contiguous rows.
+        dtype = float if fractional else np.int64
+        counts = np.atleast_1d(np.asarray(customers_count, dtype=dtype))[None, :]
+        rates = self._module_major_rates(success_rate)
+        n = len(self.names)
+        n_scenarios = counts.shape[1]
+
+        entered = np.zeros((n, n_scenarios), dtype=dtype)
+        passed = np.zeros((n, n_scenarios), dtype=dtype)
+        visit_order = []
+        visited = np.zeros(n, dtype=bool)
+
+        frontier = np.array([self.start], dtype=np.int64)
+        visits = np.ones(1, dtype=np.int64)
+        # Acyclic funnels run out of levels within len(self) steps; only
+        # funnels with loops need the step limit and loop detection
+        cyclic = self.topological_order() is None
+        seen = [set() for _ in range(n_scenarios)] if cyclic and rng is None else None
+        max_steps = self._step_limit(max_steps, exact=not fractional and rng is None)
+        steps = 0
+        stuck = False
+        while frontier.size:
+            if cyclic:
+                if max_steps is not None and steps >= max_steps:
+                    raise ValueError(f"Customers are still in the funnel after {max_steps} levels; raise max_steps")
+                if seen is not None:
+                    frontier, counts, visits, dropped = self._drop_repeats(frontier, counts, visits, seen)
+                    stuck |= dropped
+                    if not frontier.size:
+                        break
+            new = frontier[~visited[frontier]]
+            visit_order.extend(dict.fromkeys(new.tolist()))
+            visited[new] = True
+
+            pass_count, next_frontier, next_counts, next_visits = self._step(frontier, counts, visits, rates, rng, pool)
+            # A module may take several rows of a level, one per distinct count
+            np.add.at(entered, frontier, counts * visits[:, None])
+            np.add.at(passed, frontier, pass_count * visits[:, None])
+            if trace is not None:
+                trace.append((frontier, counts, visits, pass_count))
+            frontier, counts, visits = next_frontier, next_counts, next_visits
+            steps += 1
+        if stuck and trace is not None:
+            trace.clear()
+
+        order = np.array(visit_order, dtype=np.int64)
+        if not batched:
+            return order, entered[:, 0], passed[:, 0]
+        return order, entered.T, passed.T
+
+    def _step_limit(self, max_steps, exact):
+        # Whole-customer runs without random draws always end, since a
+        # repeated level is cut off and there are finitely many levels, so
+        # they need no limit unless one is given
+        if max_steps is not None or exact:
+            return max_steps
+        return max(MIN_STEP_LIMIT, STEPS_PER_MODULE * len(self.names))
+
+    def _drop_repeats(self, frontier, counts, visits, seen):
+        # Without random draws a scenario's next level depends only on its
+        # own level, so a scenario whose level repeats would recur forever:
+        # its customers are stuck in a loop (e.g. rounding keeps sending one
+        # customer round a retry loop) and leave the funnel here instead.
+        # `seen` holds one set of level hashes per scenario, so a stuck
+        # scenario is cut off without holding up the others and a batch
+        # gives the same results as running each scenario alone. Returns the
+        # level without the stuck scenarios' customers and whether any were
+        # dropped.
+        stuck = []
+        for col, (column, states) in enumerate(zip(np.ascontiguousarray(counts.T), seen)):
+            live = np.flatnonzero(column)
+            if not live.size:
+                continue
+            # The level as a set of (module, count, visits), independent of
+            # row order and of how other scenarios split the rows
+            live = live[np.lexsort((column[live], frontier[live]))]
+            modules, values = frontier[live], column[live]
+            first = np.ones(live.size, dtype=bool)
+            first[1:] = (modules[1:] != modules[:-1]) | (values[1:] != values[:-1])
+            starts = np.flatnonzero(first)
+            repeats = np.add.reduceat(visits[live], starts)
+            state = hash((modules[starts].tobytes(), values[starts].tobytes(), repeats.tobytes()))
+            if state in states:
+                stuck.append(col)
+            else:
+                states.add(state)
+        if not stuck:
+            return frontier, counts, visits, False
+        looping = (counts[:, stuck] != 0).any(axis=1)
+        modules = ', '.join(dict.fromkeys(self.names[i] for i in frontier[looping].tolist()))
+        warnings.warn(
+            f"{(counts[:, stuck] * visits[:, None]).sum():g} customers loop forever through {modules}; they are dropped",
+            RuntimeWarning, stacklevel=4
+        )
+        counts = counts.copy()
+        counts[:, stuck] = 0
+        keep = counts.any(axis=1)
+        return frontier[keep], counts[keep], visits[keep], True
+
+    def _module_major_rates(self, success_rate):
+        if success_rate is None:
+            return self.success_rate[:, None]
+        return np.ascontiguousarray(np.asarray(success_rate, dtype=float).T)
+
+    def _step(self, frontier, counts, visits, rates, rng, pool=False):
+        # Process one level: pass counts for the frontier, then the next
+        # frontier (in BFS enqueue order) with the customers arriving there.
+        # Each row stands for `visits` identical visits of `counts`
+        # customers. Float counts are expected (fractional) counts and are
+        # not rounded; flows below FLOW_EPSILON are dropped so retry loops
+        # terminate.
+        fractional = counts.dtype.kind == 'f'
+        if fractional:
+            pass_count = rates[frontier] * counts
+        elif rng is None:
+            pass_count = np.rint(rates[frontier] * counts).astype(np.int64)
+        else:
+            pass_count = rng.binomial(counts, np.broadcast_to(rates[frontier], counts.shape))
+        fail_count = counts - pass_count
+
+        # Interleave success and failure targets to keep BFS enqueue order
+        n_scenarios = counts.shape[1]
+        targets = np.column_stack((self.next_on_success[frontier], self.next_on_failure[frontier])).ravel()
+        flows = np.stack((pass_count, fail_count), axis=1).reshape(-1, n_scenarios)
+        keep = (targets >= 0) & (flows > (FLOW_EPSILON if fractional else 0)).any(axis=1)
+        targets = targets[keep]
+        flows = flows[keep]
+
+        if pool or fractional or rng is not None:
+            # Sum flows arriving at the same module into one row. Expected
+            # counts and binomial draws come out the same either way (a sum
+            # of binomials with one rate is binomial), so they always pool.
+            unique, first, inverse = np.unique(targets, return_index=True, return_inverse=True)
+            flows = flows * np.repeat(visits, 2)[keep][:, None]
+            if unique.size == targets.size:
+                next_counts = np.empty_like(flows)
+                next_counts[inverse] = flows
+            else:
+                next_counts = np.zeros((unique.size, n_scenarios), dtype=flows.dtype)
+                np.add.at(next_counts, inverse, flows)
+            by_visit = np.argsort(first)
+            return pass_count, unique[by_visit], next_counts[by_visit], np.ones(unique.size, dtype=np.int64)
+
+        # Rounded runs round every visit on its own, as if each branch's
+        # customers arrived separately. Visits of the same module with the
+        # same counts round the same way, so they share one row and only
+        # their number is kept.
+        visits = np.repeat(visits, 2)[keep]
+        ordered = np.sort(targets)
+        if not (ordered[1:] == ordered[:-1]).any():
+            return pass_count, targets, flows, visits
+        rows = np.column_stack((targets, flows))
+        order = np.lexsort(rows.T[::-1])
+        rows = rows[order]
+        starts = np.ones(order.size, dtype=bool)
+        starts[1:] = (rows[1:] != rows[:-1]).any(axis=1)
+        starts = np.flatnonzero(starts)
+        by_visit = np.argsort(np.minimum.reduceat(order, starts))
+        rows = rows[starts[by_visit]]
+        return pass_count, rows[:, 0], rows[:, 1:], np.add.reduceat(visits[order], starts)[by_visit]
+
+    def repropagate(self, trace, order, entered, passed, changed, success_rate=None, max_steps=None, pool=False):
+        # Redo a traced deterministic propagate() after the success rates of
+        # the `changed` modules moved. Levels before the first visit to a
+        # changed module are reused as they are. Recomputation stops once a
+        # level matches the old trace again and no changed module is visited
+        # after it, so only the affected downstream levels are redone.
+        # `pool` must match the traced run. Returns (order, entered, passed,
+        # trace) like propagate(); the trace is empty when customers got
+        # stuck in a loop and were dropped.
+        batched = np.ndim(entered) > 1
+        is_changed = np.zeros(len(self.names), dtype=bool)
+        is_changed[list(changed)] = True
+        touched = np.flatnonzero([is_changed[level[0]].any() for level in trace])
+        if touched.size == 0:
+            return order, entered, passed, trace
+        first, last = int(touched[0]), int(touched[-1])
+
+        rates = self._module_major_rates(success_rate)
+        entered = np.atleast_2d(entered).T.copy()
+        passed = np.atleast_2d(passed).T.copy()
+        visited = np.zeros(len(self.names), dtype=bool)
+        for level in trace[:first]:
+            visited[level[0]] = True
+        visit_order = np.asarray(order)[:int(visited.sum())].tolist()
+        new_trace = trace[:first]
+        cyclic = self.topological_order() is None
+        seen = [set() for _ in range(entered.shape[1])]
+        if cyclic:
+            for frontier, counts, visits, _ in new_trace:
+                self._drop_repeats(frontier, counts, visits, seen)
+        max_steps = self._step_limit(max_steps, exact=trace[0][1].dtype.kind != 'f')
+
+        frontier, counts, visits, _ = trace[first]
+        level = first
+        spliced = False
+        stuck = False
+        while frontier.size:
+            if cyclic:
+                if max_steps is not None and level >= max_steps:
+                    raise ValueError(f"Customers are still in the funnel after {max_steps} levels; raise max_steps")
+                frontier, counts, visits, dropped = self._drop_repeats(frontier, counts, visits, seen)
+                stuck |= dropped
+                if not frontier.size:
+                    break
+            if (
+                last < level < len(trace)
+                and np.array_equal(frontier, trace[level][0])
+                and np.array_equal(counts, trace[level][1])
+                and np.array_equal(visits, trace[level][2])
+            ):
+                spliced = True
+                break
+            new = frontier[~visited[frontier]]
+            visit_order.extend(dict.fromkeys(new.tolist()))
+            visited[new] = True
+
+            pass_count, next_frontier, next_counts, next_visits = self._step(frontier, counts, visits, rates, None, pool)
+            np.add.at(entered, frontier, counts * visits[:, None])
+            np.add.at(passed, frontier, pass_count * visits[:, None])
+            new_trace.append((frontier, counts, visits, pass_count))
+            frontier, counts, visits = next_frontier, next_counts, next_visits
+            level += 1
+
+        # Take out the old levels that were recomputed
+        for old_frontier, old_counts, old_visits, old_pass in trace[first:level if spliced else len(trace)]:
+            np.subtract.at(entered, old_frontier, old_counts * old_visits[:, None])
+            np.subtract.at(passed, old_frontier, old_pass * old_visits[:, None])
+        if spliced:
+            for old_level in trace[level:]:
+                new = old_level[0][~visited[old_level[0]]]
+                visit_order.extend(dict.fromkeys(new.tolist()))
+                visited[new] = True
+            new_trace.extend(trace[level:])
+        if stuck:
+            new_trace = []
+
+        order = np.array(visit_order, dtype=np.int64)
+        if not batched:
+            return order, entered[:, 0], passed[:, 0], new_trace
+        return order, entered.T, passed.T, new_trace
+
+    def topological_order(self):
+        # Kahn's algorithm over module-to-module edges; None when the graph
+        # has a cycle (e.g. a retry loop pointing back upstream).
+        if not hasattr(self, '_topological_order'):
+            n = len(self.names)
+            edges = np.concatenate((self.next_on_success, self.next_on_failure))
+            sources = np.concatenate((np.arange(n), np.arange(n)))
+            internal = edges >= 0
+            edges, sources = edges[internal], sources[internal]
+            in_degree = np.bincount(edges, minlength=n)
+            successors = [[] for _ in range(n)]
+            for source, target in zip(sources.tolist(), edges.tolist()):
+                successors[source].append(target)
+
+            order = []
+            ready = [idx for idx in range(n) if in_degree[idx] == 0]
+            while ready:
+                idx = ready.pop()
+                order.append(idx)
+                for target in successors[idx]:
+                    in_degree[target] -= 1
+                    if in_degree[target] == 0:
+                        ready.append(target)
+            self._topological_order = np.array(order, dtype=np.int64) if len(order) == n else None
+        return self._topological_order
+
+    def propagate_acyclic(self, customers_count, success_rate=None, rng=None):
+        # Process each module exactly once in topological order, after all
+        # of its inflow has arrived. Only valid for acyclic funnels.
+        order = self.topological_order()
+        if order is None:
+            raise ValueError("Funnel has a cycle; use propagate() instead")
+        customers = np.atleast_1d(np.asarray(customers_count, dtype=np.int64))
+        if success_rate is None:
+            rates = self.success_rate  # One scalar rate per module
+        else:
+            rates = np.asarray(success_rate, dtype=float).T
+
+        entered = np.zeros((len(self.names), customers.size), dtype=np.int64)
+        passed = np.zeros_like(entered)
+        entered[self.start] = customers
+        for idx in order.tolist():
+            count = entered[idx]
+            if not count.any():
+                continue
+            if rng is None:
+                pass_count = np.rint(rates[idx] * count).astype(np.int64)
+            else:
+                pass_count = rng.binomial(count, rates[idx])
+            passed[idx] = pass_count
+            on_success = self.next_on_success[idx]
+            on_failure = self.next_on_failure[idx]
+            if on_success >= 0:
+                entered[on_success] += pass_count
+            if on_failure >= 0:
+                entered[on_failure] += count - pass_count
+        return entered.T, passed.T
+
+    def parameter_matrix(self, columns, values):
+        # Expand a scenario matrix whose columns name module parameters
+        # ("<module>.success_rate", "<module>.cost_per_transaction",
+        # "<module>.time_to_complete") into full per-scenario arrays.
+        values = np.asarray(values, dtype=float)
+        n_scenarios = values.shape[0]
+        params = {
+            'success_rate': np.tile(self.success_rate, (n_scenarios, 1)),
+            'cost_per_transaction': np.tile(self.cost, (n_scenarios, 1)),
+            'time_to_complete': np.tile(self.time, (n_scenarios, 1)),
+        }
+        for col, column in enumerate(columns):
+            module_name, _, param = column.rpartition('.')
+            if module_name not in self.index or param not in params:
+                raise ValueError(f"Unknown scenario column: {column}")
+            params[param][:, self.index[module_name]] = values[:, col]
+        return params
@@ -1,14 +1,34 @@
-import yaml
 from modules import Module
-import pandas as pd
-from collections import deque
+from loader import read_config, validate_config, parameter_errors, ConfigError, MODULE_PARAMETERS
+from engine import CompiledFunnel, SUCCESS, FAILED
+from markov import solve_absorbing, sensitivity
+from des import simulate_queueing
+from replay import replay_periods
+from profiling import phase
+import numpy as np
+import heapq
+import itertools
 import os
+import copy
+
+RESULT_COLUMNS = [
+    "Module", "Enter Funnel", "Success Rate", "Pass", "Fail",
+    "Final Success", "Terminally Rejected", "Total Cost", "Total Time",
+    "Average Cost per Customer", "Average Time per Customer",
+    "Next Module on Success", "Next Module on Failure"
+]
 
 class Funnel:
-    def __init__(self, config_path):
+    def __init__(self, config_path, config=None, profiler=None):
         self.config_path = config_path  # Store config path for reference
-        with open(config_path, 'r') as file:
-            config = yaml.safe_load(file)
+        # An already-parsed config (e.g. from the funnel cache) skips the file
+        # read; either way it is validated once here, so runs can trust it
+        if config is None:
+            with phase(profiler, 'parse config'):
+                config = read_config(config_path)
+        with phase(profiler, 'validate'):
+            validate_config(config, config_path)
+        self.config = config
         self.modules = {}
         self.start_module = None
         for mod_conf in config['modules']:
@@ -19,108 +39,341 @@ class Funnel:
                 time_to_complete=mod_conf['time_to_complete'],
                 next_module_on_success=mod_conf.get('next_module_on_success'),
                 next_module_on_failure=mod_conf.get('next_module_on_failure'),
-                is_parallel=mod_conf.get('is_parallel', False)
+                is_parallel=mod_conf.get('is_parallel', False),
+                capacity=mod_conf.get('capacity')
             )
             self.modules[module.name] = module
             if mod_conf.get('is_start', False):
                 self.start_module = module
 
-    def run_funnel(self, customers_count):
-        total_tofu_customers = customers_count
-        columns = [
-            "Module", "Enter Funnel", "Success Rate", "Pass", "Fail",
-            "Final Success", "Terminally Rejected", "Total Cost", "Total Time",
-            "Average Cost per Customer", "Average Time per Customer",
-            "Next Module on Success", "Next Module on Failure"
-        ]
-        results = pd.DataFrame(columns=columns)
-        data = []
-
-        total_success = 0
-
-        # Initialize processing queue
-        processing_queue = deque()
-        processing_queue.append((self.start_module, customers_count))
-
-        while processing_queue:
-            current_module, count = processing_queue.popleft()
-
-            # Process the module
-            result = current_module.process(count)
-            last_row = result.iloc[-1]
-            successful_count = int(last_row["Pass"])
-            failed_count = int(last_row["Fail"])
-
-            # Add terminally rejected or final successful customers
-            if current_module.next_module_on_success == "Success":
-                total_success += successful_count
-            elif current_module.next_module_on_success and successful_count > 0:
-                # Enqueue next module on success
-                next_module = self.modules.get(current_module.next_module_on_success)
-                if next_module:
-                    processing_queue.append((next_module, successful_count))
-
-            if current_module.next_module_on_failure == "Failed":
-                pass  # Failures are terminally rejected
-            elif current_module.next_module_on_failure and failed_count > 0:
-                # Enqueue next module on failure
-                next_module = self.modules.get(current_module.next_module_on_failure)
-                if next_module:
-                    processing_queue.append((next_module, failed_count))
-
-            data.append(result)
-
-        # Combine all module results into a single DataFrame
-        results = pd.concat(data, ignore_index=True)
-
-        # Calculate total cost and time
-        total_cost = results["Total Cost"].sum()
-        total_time = results["Total Time"].sum()
-
-        # Calculate average cost and time per customer for the entire funnel
-        average_cost_per_customer = total_cost / total_tofu_customers
-        average_time_per_customer = total_time / total_tofu_customers
-
-        # Convert total time and average time to minutes for readability
-        total_time_minutes = total_time / 60
-        average_time_per_customer_minutes = average_time_per_customer / 60
-
-        # Prepare summary statistics
-        total_failures = total_tofu_customers - total_success
-        success_rate = (total_success / total_tofu_customers) * 100
+        # Customers per second entering the funnel, for queueing simulations
+        self.arrival_rate = config.get('arrival_rate')
+
+        # Compile the module graph once into integer-indexed arrays
+        with phase(profiler, 'compile'):
+            self.compiled = CompiledFunnel(self.modules, self.start_module)
+
+        # Customer segments with their own pass rates; each segment is one
+        # row of the count matrix, so all segments propagate together
+        self.segments = [segment['name'] for segment in config.get('segments') or []]
+        if self.segments:
+            shares = np.array([segment['share'] for segment in config['segments']], dtype=float)
+            self.segment_shares = shares / shares.sum()
+            self.segment_rates = np.tile(self.compiled.success_rate, (len(self.segments), 1))
+            self._segment_overrides = np.zeros(self.segment_rates.shape, dtype=bool)
+            for mod_conf in config['modules']:
+                for segment, rate in (mod_conf.get('segment_success_rates') or {}).items():
+                    position = (self.segments.index(segment), self.compiled.index[mod_conf['name']])
+                    self.segment_rates[position] = rate
+                    self._segment_overrides[position] = True
+
+        # Traced result of the last run_funnel, and modules whose success
+        # rate changed since, so edits only redo the affected levels
+        self._last_run = None
+        self._changed = set()
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def update_module(self, name, **params):
+        # Change success_rate, cost_per_transaction and/or time_to_complete
+        # of one module in place. Cost and time only rescale totals; a new
+        # success rate makes the next run_funnel with the same customer count
+        # recompute just the part of the funnel downstream of the module.
+        # Funnels from load_funnel are shared, so update a copy() of them.
+        # New values are checked like config values and raise ConfigError.
+        if name not in self.modules:
+            raise ValueError(f"Unknown module: {name}")
+        unknown = set(params) - set(MODULE_PARAMETERS)
+        if unknown:
+            raise ValueError(f"Cannot update {', '.join(sorted(unknown))}; only module parameters can change")
+        errors = parameter_errors(params, f"module {name!r}")
+        if errors:
+            raise ConfigError(errors, self.config_path)
 
+        module = self.modules[name]
+        for param, value in params.items():
+            setattr(module, param, value)
+        for mod_conf in self.config['modules']:
+            if mod_conf['name'] == name:
+                mod_conf.update(params)
+
+        # Replace parameter arrays instead of writing into them, so results
+        # of earlier runs keep the values they were computed with
+        compiled = self.compiled
+        idx = compiled.index[name]
+        if 'success_rate' in params:
+            compiled.success_rate = compiled.success_rate.copy()
+            compiled.success_rate[idx] = params['success_rate']
+            if self.segments:
+                # Segments with their own rate for this module keep it
+                self.segment_rates = self.segment_rates.copy()
+                self.segment_rates[~self._segment_overrides[:, idx], idx] = params['success_rate']
+            self._changed.add(idx)
+        if 'cost_per_transaction' in params:
+            compiled.cost = compiled.cost.copy()
+            compiled.cost[idx] = params['cost_per_transaction']
+        if 'time_to_complete' in params:
+            compiled.time = compiled.time.copy()
+            compiled.time[idx] = params['time_to_complete']
+            compiled.wall_time = compiled.critical_path_times(compiled.time)
+
+    def _propagate(self, customers_count, fractional=False, pool=False, max_steps=None):
+        if self.segments:
+            counts, rates = self._segment_customers(customers_count, fractional), self.segment_rates
+        else:
+            counts, rates = customers_count, None
+        last_run = self._last_run
+        # An empty trace means the last run dropped customers stuck in a loop
+        # and cannot be patched, so it is redone from scratch
+        if last_run is not None and last_run[0] == (customers_count, fractional, pool) and last_run[1]:
+            _, trace, order, entered, passed = last_run
+            if self._changed:
+                order, entered, passed, trace = self.compiled.repropagate(
+                    trace, order, entered, passed, self._changed,
+                    success_rate=rates, max_steps=max_steps, pool=pool
+                )
+        else:
+            trace = []
+            order, entered, passed = self.compiled.propagate(
+                counts, success_rate=rates, max_steps=max_steps, trace=trace,
+                fractional=fractional, pool=pool
+            )
+        self._changed = set()
+        self._last_run = ((customers_count, fractional, pool), trace, order, entered, passed)
+        return order, entered, passed
+
+    def run(self, customers_count, profiler=None, fractional=False, pool=False, max_steps=None):
+        # Propagate all customers through the compiled module graph and
+        # return a lightweight FunnelResult; with segments, the blended
+        # result carries one FunnelResult per segment. With fractional=True,
+        # expected counts are propagated without rounding at each module
+        # and only rounded when reported, so deep funnels with small counts
+        # do not drift. With pool=True, customers reaching a module at the
+        # same step through different branches are rounded together instead
+        # of per branch. max_steps caps the propagation levels of funnels
+        # with loops (see CompiledFunnel.propagate).
+        compiled = self.compiled
+        with phase(profiler, 'propagate'):
+            order, entered, passed = self._propagate(customers_count, fractional, pool, max_steps)
+        if not self.segments:
+            return FunnelResult(compiled, customers_count, order, entered, passed, compiled.success_rate)
+
+        segment_results = {
+            name: FunnelResult(compiled, count, order, entered[s], passed[s], self.segment_rates[s])
+            for s, (name, count) in enumerate(zip(self.segments, self._segment_customers(customers_count, fractional)))
+        }
+        entered, passed = entered.sum(axis=0), passed.sum(axis=0)
+        # Blended pass rate actually seen across segments
+        rates = np.divide(passed, entered, out=compiled.success_rate.copy(), where=entered > 0)
+        return FunnelResult(compiled, customers_count, order, entered, passed, rates, segment_results)
+
+    def run_funnel(self, customers_count, verbose=True, profiler=None, fractional=False, pool=False, max_steps=None):
+        result = self.run(customers_count, profiler, fractional, pool, max_steps)
+        with phase(profiler, 'results table'):
+            results = result.to_frame()
+
+        metrics = result.metrics()
         summary_stats = {
             'text': (
-                f"- **Total Success:** {total_success}\n"
-                f"- **Total Failures:** {total_failures}\n"
-                f"- **Success Rate:** {success_rate:.2f}%\n"
-                f"- **Total Cost:** ₹{total_cost:.2f}\n"
-                f"- **Total Time:** {total_time_minutes:.2f} minutes\n"
-                f"- **Average Cost per Customer:** ₹{average_cost_per_customer:.2f}\n"
-                f"- **Average Time per Customer:** {average_time_per_customer_minutes:.2f} minutes"
+                f"- **Total Success:** {metrics['Total Success']}\n"
+                f"- **Total Failures:** {metrics['Total Failures']}\n"
+                f"- **Success Rate:** {metrics['Success Rate']:.2f}%\n"
+                f"- **Total Cost:** ₹{metrics['Total Cost']:.2f}\n"
+                f"- **Total Time:** {metrics['Total Time']:.2f} minutes\n"
+                f"- **Average Cost per Customer:** ₹{metrics['Average Cost per Customer']:.2f}\n"
+                f"- **Average Time per Customer:** {metrics['Average Time per Customer']:.2f} minutes\n"
+                f"- **Average Latency per Customer:** {metrics['Average Latency per Customer']:.2f} minutes"
             ),
-            'metrics': {
-                'Total Success': total_success,
-                'Total Failures': total_failures,
-                'Success Rate': success_rate,
-                'Total Cost': total_cost,
-                'Total Time': total_time_minutes,
-                'Average Cost per Customer': average_cost_per_customer,
-                'Average Time per Customer': average_time_per_customer_minutes
-            }
+            'metrics': metrics
         }
+        if result.segment_results:
+            with phase(profiler, 'segments'):
+                segments = segment_report(result.segment_results)
+                summary_stats['text'] += ''.join(
+                    f"\n- **{name}:** {row['Success Rate']:.2f}% success, ₹{row['Average Cost per Customer']:.2f} per customer"
+                    for name, row in segments.iterrows()
+                )
+                summary_stats['segments'] = segments
+                summary_stats['segment_results'] = {
+                    name: segment.to_frame() for name, segment in result.segment_results.items()
+                }
 
         # Print summary statistics to terminal
-        print(f"Total Success: {total_success}")
-        print(f"Total Failures: {total_failures}")
-        print(f"Success Rate: {success_rate:.2f}%")
-        print(f"Total Cost: ₹{total_cost:.2f}")
-        print(f"Total Time: {total_time_minutes:.2f} minutes")
-        print(f"Average Cost per Customer: ₹{average_cost_per_customer:.2f}")
-        print(f"Average Time per Customer: {average_time_per_customer_minutes:.2f} minutes")
+        if verbose:
+            print(f"Total Success: {metrics['Total Success']}")
+            print(f"Total Failures: {metrics['Total Failures']}")
+            print(f"Success Rate: {metrics['Success Rate']:.2f}%")
+            print(f"Total Cost: ₹{metrics['Total Cost']:.2f}")
+            print(f"Total Time: {metrics['Total Time']:.2f} minutes")
+            print(f"Average Cost per Customer: ₹{metrics['Average Cost per Customer']:.2f}")
+            print(f"Average Time per Customer: {metrics['Average Time per Customer']:.2f} minutes")
+            print(f"Average Latency per Customer: {metrics['Average Latency per Customer']:.2f} minutes")
 
         return results, summary_stats
 
+    def segment_counts(self, customers_count):
+        # Split customers across segments by share, largest remainder first,
+        # so the segment counts always add up to customers_count. An array
+        # of counts gives one row of segment counts per entry.
+        exact = np.multiply.outer(customers_count, self.segment_shares)
+        counts = np.floor(exact).astype(np.int64)
+        remainder = np.asarray(customers_count) - counts.sum(axis=-1)
+        rank = np.argsort(np.argsort(counts - exact, axis=-1, kind='stable'), axis=-1)
+        return counts + (rank < remainder[..., None])
+
+    def _segment_customers(self, customers_count, fractional):
+        # Fractional runs split customers exactly by share
+        if fractional:
+            return np.multiply.outer(customers_count, self.segment_shares)
+        return self.segment_counts(customers_count)
+
+    def _segment_rows(self, customers, success_rate=None):
+        # Expand per-scenario customer counts (and optionally per-scenario
+        # base rates) into one row per (scenario, segment). A scenario rate
+        # replaces a module's success_rate; segments with their own rate for
+        # that module keep it, as with update_module.
+        counts = self.segment_counts(customers).ravel()
+        if success_rate is None:
+            return counts, np.tile(self.segment_rates, (customers.size, 1))
+        rates = np.where(self._segment_overrides, self.segment_rates, success_rate[:, None, :])
+        return counts, rates.reshape(counts.size, -1)
+
+    def _fold_segments(self, values):
+        # Sum (scenario x segment, modules) rows back to one row per scenario
+        return values.reshape(-1, len(self.segments), values.shape[-1]).sum(axis=1)
+
+    def run_batch(self, scenarios, columns=None, customers_count=None, pool=False, max_steps=None):
+        # Evaluate many scenarios in one vectorized pass. Rows of `scenarios`
+        # are scenarios; columns are "customers_count" and/or module
+        # parameters named "<module>.<parameter>". A scalar customers_count
+        # applies to every scenario when the matrix has no such column.
+        # With segments, every scenario is split across them like run().
+        # pool and max_steps are as for run().
+        import pandas as pd
+        if isinstance(scenarios, pd.DataFrame):
+            columns = list(scenarios.columns)
+            values = scenarios.to_numpy(dtype=float)
+        else:
+            values = np.atleast_2d(np.asarray(scenarios, dtype=float))
+            columns = list(columns or [])
+        if values.shape[1] != len(columns):
+            raise ValueError("Scenario matrix must have one column per name in `columns`")
+
+        if 'customers_count' in columns:
+            col = columns.index('customers_count')
+            customers = values[:, col].astype(np.int64)
+            values = np.delete(values, col, axis=1)
+            columns = columns[:col] + columns[col + 1:]
+        elif customers_count is not None:
+            customers = np.full(values.shape[0], customers_count, dtype=np.int64)
+        else:
+            raise ValueError("customers_count must be given as a column or argument")
+
+        compiled = self.compiled
+        params = compiled.parameter_matrix(columns, values)
+        if self.segments:
+            counts, rates = self._segment_rows(customers, params['success_rate'])
+            _, entered, passed = compiled.propagate(counts, success_rate=rates, max_steps=max_steps, pool=pool)
+            entered, passed = self._fold_segments(entered), self._fold_segments(passed)
+        else:
+            _, entered, passed = compiled.propagate(
+                customers, success_rate=params['success_rate'], max_steps=max_steps, pool=pool
+            )
+        total_success = np.where(compiled.next_on_success == SUCCESS, passed, 0).sum(axis=1)
+        total_cost = (entered * params['cost_per_transaction']).sum(axis=1)
+        total_time = (entered * params['time_to_complete']).sum(axis=1)
+        total_latency = (entered * compiled.critical_path_times(params['time_to_complete'])).sum(axis=1)
+
+        return pd.DataFrame(summarize(customers, total_success, total_cost, total_time, total_latency))
+
+    def run_monte_carlo(self, customers_count, replications=1000, seed=None, percentiles=(5, 50, 95), max_steps=None):
+        # Run all replications at once with binomial pass counts and report
+        # the mean, standard deviation and percentile bands of each metric.
+        # Binomial draws are additive, so acyclic funnels can pool all inflow
+        # to a module and draw once per module instead of once per visit.
+        # With segments, each replication is split across them like run().
+        # max_steps is as for run().
+        import pandas as pd
+        compiled = self.compiled
+        rng = np.random.default_rng(seed)
+        customers = np.full(replications, customers_count, dtype=np.int64)
+        counts, rates = self._segment_rows(customers) if self.segments else (customers, None)
+        if compiled.topological_order() is not None:
+            entered, passed = compiled.propagate_acyclic(counts, success_rate=rates, rng=rng)
+        else:
+            _, entered, passed = compiled.propagate(counts, success_rate=rates, rng=rng, max_steps=max_steps)
+        if self.segments:
+            entered, passed = self._fold_segments(entered), self._fold_segments(passed)
+        total_success = passed[:, compiled.next_on_success == SUCCESS].sum(axis=1)
+        total_cost = entered @ compiled.cost
+        total_time = entered @ compiled.time
+        total_latency = entered @ compiled.wall_time
+
+        samples = summarize(customers, total_success, total_cost, total_time, total_latency)
+        bands = {}
+        for metric, values in samples.items():
+            values = np.asarray(values, dtype=float)
+            band = {'mean': values.mean(), 'std': values.std(ddof=1) if replications > 1 else 0.0}
+            for q, value in zip(percentiles, np.percentile(values, percentiles)):
+                band[f'p{q:g}'] = value
+            bands[metric] = band
+        return pd.DataFrame(bands).T
+
+    def absorption_metrics(self):
+        # Closed-form outcome probabilities and expected cost/time (seconds)
+        # per customer; one pass over the modules plus a small solve per
+        # retry loop, and exact for funnels with retry loops, unlike path
+        # enumeration. With segments, each segment is solved with its own
+        # rates and blended by share.
+        if not self.segments:
+            return solve_absorbing(self.compiled)
+        per_segment = [solve_absorbing(self.compiled, rates) for rates in self.segment_rates]
+        blended = {
+            key: float(sum(share * metrics[key] for share, metrics in zip(self.segment_shares, per_segment)))
+            for key in per_segment[0] if key != 'Expected Visits'
+        }
+        blended['Expected Visits'] = {
+            name: float(sum(share * metrics['Expected Visits'][name] for share, metrics in zip(self.segment_shares, per_segment)))
+            for name in self.compiled.names
+        }
+        return blended
+
+    def sensitivity_report(self):
+        # Derivative and elasticity of success probability, expected cost and
+        # expected time per customer with respect to every module's
+        # success_rate, cost_per_transaction and time_to_complete, most
+        # influential first.
+        import pandas as pd
+        report = pd.DataFrame(sensitivity(self.compiled))
+        order = report['Elasticity'].abs().sort_values(ascending=False, kind='stable').index
+        return report.loc[order].reset_index(drop=True)
+
+    def run_queueing(self, customers_count, arrival_rate=None, seed=None):
+        # Discrete-event simulation with per-module worker capacity. Returns
+        # per-module queue, utilization and latency statistics (seconds) and
+        # an end-to-end summary. arrival_rate defaults to the config value.
+        arrival_rate = arrival_rate if arrival_rate is not None else self.arrival_rate
+        return simulate_queueing(self.compiled, customers_count, arrival_rate, seed=seed)
+
+    def replay(self, arrivals, period_seconds=86400):
+        # Feed a series of per-period arrival counts through the funnel in
+        # one batched propagation (one scenario per period) and return
+        # per-period, per-module results plus a per-period summary. Activity
+        # is shifted into later periods by each module's latency.
+        arrivals = np.asarray(arrivals, dtype=np.int64)
+        if arrivals.ndim != 1 or arrivals.size == 0:
+            raise ValueError("arrivals must be a non-empty 1-D series of counts")
+        compiled = self.compiled
+        if self.segments:
+            # Every (period, segment) pair is its own scenario row
+            counts, rates = self._segment_rows(arrivals)
+            _, entered, passed = compiled.propagate(counts, success_rate=rates)
+            entered, passed = self._fold_segments(entered), self._fold_segments(passed)
+        else:
+            _, entered, passed = compiled.propagate(arrivals)
+        return replay_periods(compiled, arrivals, entered, passed, period_seconds)
+
     def build_graph(self):
         graph = {}
         for module in self.modules.values():
@@ -135,53 +388,215 @@ class Funnel:
         return graph
 
     def get_all_paths(self):
+        return list(self.iter_paths())
+
+    def iter_paths(self):
+        # Lazily yield every simple root-to-terminal path, in the same
+        # depth-first order as before. Only the current path and one edge
+        # iterator per level are held in memory.
         graph = self.build_graph()
         start_module = self.start_module.name
-        paths = []
-        self._dfs(graph, start_module, [], paths)
-        return paths
-
-    def _dfs(self, graph, current_module, path, paths):
-        if not path:
-            # For the start module, we don't have an outcome yet
-            path = []
-        if current_module == 'Success' or current_module == 'Failed':
-            paths.append(path + [(current_module, None)])
-            return
-        if current_module not in graph:
-            return
-        for next_module, outcome in graph[current_module]:
-            self._dfs(graph, next_module, path + [(current_module, outcome)], paths)
+        path = []
+        on_path = {start_module}
+        stack = [(start_module, iter(graph[start_module]))]
+        while stack:
+            current_module, edges = stack[-1]
+            edge = next(edges, None)
+            if edge is None:
+                stack.pop()
+                on_path.discard(current_module)
+                if path:
+                    path.pop()
+                continue
+            next_module, outcome = edge
+            if next_module == 'Success' or next_module == 'Failed':
+                yield path + [(current_module, outcome), (next_module, None)]
+                continue
+            # Only follow simple paths so retry loops cannot recurse forever;
+            # absorption_metrics() accounts for repeated visits exactly.
+            if next_module not in graph or next_module in on_path:
+                continue
+            path.append((current_module, outcome))
+            on_path.add(next_module)
+            stack.append((next_module, iter(graph[next_module])))
+
+    def iter_path_metrics(self):
+        for path in self.iter_paths():
+            yield self._path_metrics(path)
 
     def compute_path_metrics(self):
-        paths = self.get_all_paths()
-        path_metrics = []
-        for path in paths:
-            probability = 1.0
-            total_cost = 0.0
-            total_time = 0.0
-            path_str = ''
-            end_node = ''
-            for i, (module_name, outcome) in enumerate(path):
-                if module_name == 'Success' or module_name == 'Failed':
-                    end_node = module_name
+        return list(self.iter_path_metrics())
+
+    def _path_metrics(self, path):
+        probability = 1.0
+        total_cost = 0.0
+        total_time = 0.0
+        wall_clock_time = 0.0
+        path_str = ''
+        end_node = ''
+        for module_name, outcome in path:
+            if module_name == 'Success' or module_name == 'Failed':
+                end_node = module_name
+                continue
+            module = self.modules[module_name]
+            if outcome == 'success':
+                probability *= module.success_rate
+            elif outcome == 'failure':
+                probability *= (1 - module.success_rate)
+            else:
+                continue
+            total_cost += module.cost_per_transaction
+            total_time += module.time_to_complete
+            wall_clock_time += self.compiled.wall_time[self.compiled.index[module_name]]
+            path_str += f"{module_name} ({outcome}) -> "
+        path_str += end_node
+        return {
+            'Path': path_str,
+            'End': end_node,
+            'Probability': probability,
+            'Total Cost': total_cost,
+            'Total Time': total_time,
+            'Wall-Clock Time': float(wall_clock_time)
+        }
+
+    def top_k_paths(self, k, min_probability=0.0):
+        # Best-first search for the k most probable root-to-terminal paths.
+        # Extending a path can only lower its probability, so terminal paths
+        # leave the heap in descending order of probability. Partial paths
+        # below min_probability are pruned, which also bounds retry loops.
+        graph = self.build_graph()
+        counter = itertools.count()
+        # Heap entries: (-probability, tie-breaker, module, partial path)
+        # where the partial path is a (module, outcome, parent) linked list.
+        heap = [(-1.0, next(counter), self.start_module.name, None)]
+        top_paths = []
+        while heap and len(top_paths) < k:
+            neg_probability, _, current_module, partial = heapq.heappop(heap)
+            if current_module == 'Success' or current_module == 'Failed':
+                path = [(current_module, None)]
+                while partial is not None:
+                    module_name, outcome, partial = partial
+                    path.append((module_name, outcome))
+                top_paths.append(self._path_metrics(path[::-1]))
+                continue
+            module = self.modules[current_module]
+            for next_module, outcome in graph[current_module]:
+                if next_module not in graph:
                     continue
-                module = self.modules[module_name]
-                if outcome == 'success':
-                    probability *= module.success_rate
-                elif outcome == 'failure':
-                    probability *= (1 - module.success_rate)
-                else:
+                rate = module.success_rate if outcome == 'success' else 1 - module.success_rate
+                probability = -neg_probability * rate
+                if probability <= 0 or probability < min_probability:
                     continue
-                total_cost += module.cost_per_transaction
-                total_time += module.time_to_complete
-                path_str += f"{module_name} ({outcome}) -> "
-            path_str += end_node
-            path_metrics.append({
-                'Path': path_str,
-                'End': end_node,
-                'Probability': probability,
-                'Total Cost': total_cost,
-                'Total Time': total_time
-            })
-        return path_metrics
+                heapq.heappush(heap, (-probability, next(counter), next_module, (current_module, outcome, partial)))
+        return top_paths
+
+class FunnelResult:
+    # Outcome of one run as arrays: the visit order and per-module entered
+    # and passed counts. The 13-column results table is only built by
+    # to_frame(), so batch jobs can keep many results cheaply. Parameter
+    # arrays are captured at run time; update_module replaces rather than
+    # mutates them, so a result never changes after the fact.
+    __slots__ = (
+        'customers_count', 'order', 'entered', 'passed', 'rates',
+        'cost', 'time', 'wall_time', 'compiled', 'segment_results'
+    )
+
+    def __init__(self, compiled, customers_count, order, entered, passed, rates, segment_results=None):
+        self.compiled = compiled
+        self.customers_count = customers_count
+        self.order = order
+        self.entered = entered
+        self.passed = passed
+        self.rates = rates
+        self.cost = compiled.cost
+        self.time = compiled.time
+        self.wall_time = compiled.wall_time
+        self.segment_results = segment_results
+
+    @property
+    def fractional(self):
+        return self.entered.dtype.kind == 'f'
+
+    @property
+    def total_success(self):
+        total = self.passed[self.compiled.next_on_success == SUCCESS].sum()
+        return float(total) if self.fractional else int(total)
+
+    def metrics(self):
+        # Rates, costs and times use the exact counts; in fractional runs
+        # the success and failure counts are rounded for reporting
+        order = self.order
+        total_cost = (self.cost[order] * self.entered[order]).sum()
+        total_time = (self.time[order] * self.entered[order]).sum()
+        total_latency = float(self.entered @ self.wall_time)
+        metrics = summarize(self.customers_count, self.total_success, total_cost, total_time, total_latency)
+        if self.fractional:
+            metrics['Total Success'] = int(round(metrics['Total Success']))
+            metrics['Total Failures'] = int(round(self.customers_count)) - metrics['Total Success']
+        return metrics
+
+    def to_frame(self):
+        # One row per visited module, in visit order
+        import pandas as pd
+        compiled = self.compiled
+        order = self.order
+        entered = self.entered[order]
+        passed = self.passed[order]
+        # Counts are rounded for the table; costs and times stay exact
+        exact_entered = entered
+        if self.fractional:
+            entered = np.rint(entered).astype(np.int64)
+            passed = np.rint(passed).astype(np.int64)
+        failed = entered - passed
+        return pd.DataFrame({
+            "Module": [compiled.names[i] for i in order],
+            "Enter Funnel": entered,
+            "Success Rate": [f"{rate * 100:.0f}%" for rate in self.rates[order]],
+            "Pass": passed,
+            "Fail": failed,
+            "Final Success": np.where(compiled.next_on_success[order] == SUCCESS, passed, 0),
+            "Terminally Rejected": np.where(compiled.next_on_failure[order] == FAILED, failed, 0),
+            "Total Cost": self.cost[order] * exact_entered,
+            "Total Time": self.time[order] * exact_entered,
+            "Average Cost per Customer": self.cost[order],
+            "Average Time per Customer": self.time[order],
+            "Next Module on Success": [compiled.success_labels[i] for i in order],
+            "Next Module on Failure": [compiled.failure_labels[i] for i in order]
+        }, columns=RESULT_COLUMNS)
+
+def segment_report(segment_results):
+    # Summary metrics per segment, one row per segment
+    import pandas as pd
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rows = [
+            {'Customers': int(round(result.customers_count)), **result.metrics()}
+            for result in segment_results.values()
+        ]
+    return pd.DataFrame(rows, index=pd.Index(list(segment_results), name='Segment'))
+
+def summarize(customers_count, total_success, total_cost, total_time, total_latency):
+    # Summary metrics shared by single runs and batched sweeps; works on
+    # scalars as well as per-scenario arrays. Total Time is summed effort
+    # across modules; latency is end-to-end wall-clock time, where modules
+    # in a parallel group overlap.
+    total_failures = customers_count - total_success
+    success_rate = (total_success / customers_count) * 100
+
+    # Calculate average cost and time per customer for the entire funnel
+    average_cost_per_customer = total_cost / customers_count
+    average_time_per_customer = total_time / customers_count
+
+    # Convert total time and average time to minutes for readability
+    total_time_minutes = total_time / 60
+    average_time_per_customer_minutes = average_time_per_customer / 60
+
+    return {
+        'Total Success': total_success,
+        'Total Failures': total_failures,
+        'Success Rate': success_rate,
+        'Total Cost': total_cost,
+        'Total Time': total_time_minutes,
+        'Average Cost per Customer': average_cost_per_customer,
+        'Average Time per Customer': average_time_per_customer_minutes,
+        'Average Latency per Customer': total_latency / customers_count / 60
+    }
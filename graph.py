@@ -0,0 +1,86 @@
+import numpy as np
+
+# Graphviz DOT source for a compiled funnel, optionally limited to the
+# neighborhood of one module so large funnels stay quick to lay out.
+
+def _quote(name):
+    return '"' + str(name).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def neighborhood(compiled, focus, radius):
+    # Boolean mask of the modules at most `radius` edges away from `focus`,
+    # following edges in either direction
+    n = len(compiled)
+    sources = np.concatenate([np.arange(n), np.arange(n)])
+    targets = np.concatenate([compiled.next_on_success, compiled.next_on_failure])
+    internal = targets >= 0
+    sources, targets = sources[internal], targets[internal]
+
+    included = np.zeros(n, dtype=bool)
+    included[compiled.index[focus]] = True
+    frontier = included.copy()
+    for _ in range(radius):
+        reached = np.zeros(n, dtype=bool)
+        reached[targets[frontier[sources]]] = True
+        reached[sources[frontier[targets]]] = True
+        frontier = reached & ~included
+        if not frontier.any():
+            break
+        included |= frontier
+    return included
+
+def funnel_dot(compiled, focus=None, radius=2):
+    # With a focus module, only its neighborhood is drawn; modules just
+    # outside it that are linked from inside are drawn dashed
+    if focus is None:
+        included = np.ones(len(compiled), dtype=bool)
+    else:
+        included = neighborhood(compiled, focus, radius)
+    names = compiled.names
+
+    graph_lines = ['digraph G {']
+    graph_lines.append('rankdir=LR;')  # Left to right orientation
+    graph_lines.append('node [shape=box, style=filled, color="#EEEEEE"];')
+
+    # Define nodes
+    shown = np.flatnonzero(included)
+    for idx in shown:
+        highlight = ', penwidth=3' if names[idx] == focus else ''
+        graph_lines.append(f'{_quote(names[idx])} [label={_quote(names[idx])}{highlight}];')
+
+    # Define edges; missing next modules have no edge. Terminals are drawn
+    # as configured, even on the opposite edge (e.g. failures to "Success")
+    outside = set()
+    terminals = set()
+    for idx in shown:
+        edges = (
+            (compiled.next_on_success[idx], compiled.success_labels[idx], 'Success', 'green'),
+            (compiled.next_on_failure[idx], compiled.failure_labels[idx], 'Failure', 'red'),
+        )
+        for target, target_label, label, color in edges:
+            if target >= 0:
+                target_name = names[target]
+                if not included[target]:
+                    outside.add(target_name)
+            elif target_label in ('Success', 'Failed'):
+                terminals.add(target_label)
+                target_name = target_label
+            else:
+                continue
+            graph_lines.append(f'{_quote(names[idx])} -> {_quote(target_name)} [label="{label}", color="{color}"];')
+
+    for name in sorted(outside):
+        graph_lines.append(f'{_quote(name)} [style=dashed];')
+
+    # Add Success and Failed nodes if they are used
+    if 'Success' in terminals:
+        graph_lines.append('"Success" [shape=doublecircle, style=filled, color="green"];')
+    if 'Failed' in terminals:
+        graph_lines.append('"Failed" [shape=doublecircle, style=filled, color="red"];')
+
+    # Start node
+    if included[compiled.start]:
+        graph_lines.append(f'Start -> {_quote(names[compiled.start])};')
+        graph_lines.append('Start [shape=Mdiamond];')
+
+    graph_lines.append('}')
+    return '\n'.join(graph_lines)
@@ -0,0 +1,233 @@
+import json
+import numbers
+import os
+
+# Reads funnel configs and validates them once, at load time. YAML goes
+# through libyaml's C loader when PyYAML was built with it; .json and
+# .msgpack configs load faster still for very large funnels (MessagePack
+# needs the optional msgpack package). PyYAML is only imported for YAML.
+
+CONFIG_EXTENSIONS = ('.yaml', '.yml', '.json', '.msgpack')
+TERMINALS = ('Success', 'Failed')
+MODULE_PARAMETERS = ('success_rate', 'cost_per_transaction', 'time_to_complete')
+
+class ConfigError(ValueError):
+    # Raised with every problem found in a config, not just the first
+    def __init__(self, errors, source=None):
+        self.errors = list(errors)
+        self.source = source
+        prefix = f"Invalid config {source}" if source else "Invalid config"
+        super().__init__(f"{prefix}:\n" + "\n".join(f"  - {error}" for error in self.errors))
+
+def parse_config(content, config_path=None):
+    # content: the raw bytes of a config file; the format follows the
+    # file extension and defaults to YAML
+    extension = os.path.splitext(config_path or '')[1].lower()
+    if extension == '.json':
+        try:
+            return json.loads(content)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise ConfigError([f"cannot parse: {e}"], config_path) from e
+    if extension == '.msgpack':
+        try:
+            import msgpack
+        except ImportError:
+            raise ConfigError(["MessagePack configs need the msgpack package"], config_path) from None
+        try:
+            return msgpack.unpackb(content, raw=False)
+        except (ValueError, msgpack.UnpackException) as e:
+            raise ConfigError([f"cannot parse: {e}"], config_path) from e
+
+    import yaml
+    try:
+        return yaml.load(content, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    except yaml.YAMLError as e:
+        raise ConfigError([f"cannot parse: {e}"], config_path) from e
+
+def read_config(config_path):
+    with open(config_path, 'rb') as file:
+        return parse_config(file.read(), config_path)
+
+_PLAIN_NUMBERS = (int, float)
+
+def _label(name, position):
+    return f"module {name!r}" if name else f"modules[{position}]"
+
+def _is_number(value):
+    # Plain ints and floats first; the numbers.Real check is slow
+    return type(value) in _PLAIN_NUMBERS or (isinstance(value, numbers.Real) and not isinstance(value, bool))
+
+def parameter_errors(params, label, fields=None):
+    # Problems with the module parameters in `params`: the given fields
+    # (missing ones included), or every key of `params`, which must be
+    # MODULE_PARAMETERS; also used to check in-place module edits
+    errors = []
+    for field in fields or params:
+        value = params.get(field)
+        if not _is_number(value):
+            errors.append(f"{label} needs a numeric {field}")
+        elif field == 'success_rate' and not 0 <= value <= 1:
+            errors.append(f"{label} has success_rate {value} outside [0, 1]")
+        elif value < 0:
+            errors.append(f"{label} has negative {field} {value}")
+    return errors
+
+def validate_config(config, source=None):
+    # Checks the whole config and raises one ConfigError listing all
+    # problems: missing or non-numeric fields, rates outside [0, 1],
+    # duplicate names, next modules that do not exist or send customers to
+    # the opposite terminal, parallel group members entered other than from
+    # the member before them, and anything but exactly one start module.
+    # Missing next modules are allowed; those customers leave the funnel.
+    if not isinstance(config, dict) or not isinstance(config.get('modules'), list) or not config['modules']:
+        raise ConfigError(["config needs a non-empty 'modules' list"], source)
+
+    # Segments first, so each module's segment rates are checked in the
+    # same pass as the rest of the module; their errors are listed last
+    segments = []
+    segment_errors = []
+    segment_confs = config.get('segments') or []
+    if not isinstance(segment_confs, list):
+        segment_errors.append("segments must be a list")
+        segment_confs = []
+    for position, segment in enumerate(segment_confs):
+        if not isinstance(segment, dict) or not segment.get('name') or not isinstance(segment['name'], str):
+            segment_errors.append(f"segments[{position}] needs a name")
+            continue
+        if segment['name'] in segments:
+            segment_errors.append(f"segment {segment['name']!r} is defined more than once")
+        segments.append(segment['name'])
+        share = segment.get('share')
+        if not _is_number(share) or share <= 0:
+            segment_errors.append(f"segment {segment['name']!r} needs a positive share")
+
+    errors = []
+    names = set()
+    starts = []
+    parallel = set()
+    on_success_targets = []
+    on_failure_targets = []
+    for position, mod_conf in enumerate(config['modules']):
+        if type(mod_conf) is not dict and not isinstance(mod_conf, dict):
+            errors.append(f"modules[{position}] is not a mapping")
+            continue
+        name = mod_conf.get('name')
+        if type(name) is str and name and name not in names and name not in TERMINALS:
+            names.add(name)
+        elif not name or not isinstance(name, str):
+            errors.append(f"{_label(name, position)} needs a name")
+        elif name in names:
+            errors.append(f"{_label(name, position)} is defined more than once")
+        elif name in TERMINALS:
+            errors.append(f"{_label(name, position)} uses a reserved terminal name")
+        else:
+            names.add(name)
+
+        # Plain in-range numbers pass without building a label
+        rate = mod_conf.get('success_rate')
+        cost = mod_conf.get('cost_per_transaction')
+        time = mod_conf.get('time_to_complete')
+        if not (
+            type(rate) in _PLAIN_NUMBERS and type(cost) in _PLAIN_NUMBERS and type(time) in _PLAIN_NUMBERS
+            and 0 <= rate <= 1 and cost >= 0 and time >= 0
+        ):
+            errors.extend(parameter_errors(mod_conf, _label(name, position), MODULE_PARAMETERS))
+        capacity = mod_conf.get('capacity')
+        if capacity is not None and (not isinstance(capacity, int) or isinstance(capacity, bool) or capacity <= 0):
+            errors.append(f"{_label(name, position)} has capacity {capacity!r}; use a positive integer")
+        if mod_conf.get('is_start', False):
+            starts.append(name)
+        if mod_conf.get('is_parallel') and isinstance(name, str):
+            parallel.add(name)
+        on_success_targets.append(mod_conf.get('next_module_on_success'))
+        on_failure_targets.append(mod_conf.get('next_module_on_failure'))
+
+        segment_rates = mod_conf.get('segment_success_rates')
+        if segment_rates:
+            segment_errors.extend(_segment_rate_errors(name, segment_rates, segments))
+
+    # References are checked once every name is known, module by module
+    # only if some target is not a known module or the matching terminal
+    try:
+        unknown = (set(on_success_targets) - names - {'Success', None, ''}
+                   or set(on_failure_targets) - names - {'Failed', None, ''})
+    except TypeError:  # Unhashable targets
+        unknown = True
+    if unknown:
+        errors.extend(_reference_errors(config['modules'], names))
+
+    if parallel:
+        errors.extend(_parallel_entry_errors(config['modules'], parallel, starts))
+
+    if not starts:
+        errors.append("no module has is_start: true")
+    elif len(starts) > 1:
+        errors.append(f"only one start module is allowed, found {len(starts)}: {', '.join(map(str, starts))}")
+
+    arrival_rate = config.get('arrival_rate')
+    if arrival_rate is not None and (not _is_number(arrival_rate) or arrival_rate <= 0):
+        errors.append(f"arrival_rate {arrival_rate!r} must be a positive number")
+    errors.extend(segment_errors)
+
+    if errors:
+        raise ConfigError(errors, source)
+
+def _reference_errors(modules, names):
+    errors = []
+    for position, mod_conf in enumerate(modules):
+        if not isinstance(mod_conf, dict):
+            continue
+        label = _label(mod_conf.get('name'), position)
+        edges = (
+            ('next_module_on_success', 'successful', 'Failed'),
+            ('next_module_on_failure', 'failed', 'Success'),
+        )
+        for field, outcome, opposite in edges:
+            target = mod_conf.get(field)
+            if target is not None and not isinstance(target, str):
+                errors.append(f"{label} has {field} {target!r}; use a module name")
+            elif target == opposite:
+                errors.append(f"{label} sends {outcome} customers to {opposite!r}")
+            elif target and target not in names and target not in TERMINALS:
+                errors.append(f"{label} has unknown {field} {target!r}")
+    return errors
+
+def _segment_rate_errors(name, segment_rates, segments):
+    if not isinstance(segment_rates, dict):
+        return [f"module {name!r} has segment_success_rates {segment_rates!r}; use a mapping of segment to rate"]
+    errors = []
+    for segment, rate in segment_rates.items():
+        if segment not in segments:
+            errors.append(f"module {name!r} has a rate for unknown segment {segment!r}")
+        elif not _is_number(rate) or not 0 <= rate <= 1:
+            errors.append(f"module {name!r} has segment {segment!r} success rate {rate!r} outside [0, 1]")
+    return errors
+
+def _parallel_entry_errors(modules, parallel, starts):
+    # A parallel group is charged as the running maximum of its members'
+    # times from the head on (CompiledFunnel.critical_path_times), which
+    # only holds for customers who entered at the head. So a member that
+    # follows another parallel module on success may only be reached by
+    # that one edge, and cannot be the start module.
+    sources = {}
+    for mod_conf in modules:
+        if not isinstance(mod_conf, dict):
+            continue
+        for field in ('next_module_on_success', 'next_module_on_failure'):
+            target = mod_conf.get(field)
+            if isinstance(target, str) and target in parallel:
+                sources.setdefault(target, []).append((mod_conf.get('name'), field))
+    errors = []
+    for name, edges in sources.items():
+        inside = [source for source, field in edges if source in parallel and field == 'next_module_on_success']
+        if inside and (len(edges) > 1 or name in starts):
+            errors.append(
+                f"module {name!r} follows {inside[0]!r} in a parallel group; "
+                f"customers can only enter it from {inside[0]!r}"
+            )
+    return errors
+
+def load_config(config_path):
+    config = read_config(config_path)
+    validate_config(config, config_path)
+    return config
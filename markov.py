@@ -0,0 +1,226 @@
+import numpy as np
+from engine import SUCCESS, FAILED, DROPPED
+
+# Treats the compiled module graph as an absorbing Markov chain: modules are
+# transient states, and Success, Failed and unrouted edges are absorbing.
+# Everything follows from the fundamental matrix N = (I - Q)^-1, which is
+# never formed explicitly. Q has at most two entries per row, so the linear
+# systems are solved one strongly connected component at a time, in
+# topological order: acyclic funnels take a single pass over the modules,
+# and only modules on a shared retry loop are solved together.
+#
+# Only modules customers can actually reach from the start module are
+# solved; the rest get 0. Edges taken with probability 0 are ignored, so a
+# reachable component with no edge out of it is exactly a loop customers
+# can never leave, and raises ValueError instead of yielding a singular
+# (or numerically garbage) solve.
+
+def components(compiled, successors, probs):
+    # Strongly connected components of the modules reachable from the
+    # start, over edges taken with positive probability, as lists of
+    # module indices, upstream first
+    order = compiled.topological_order()
+    if order is None:
+        return _tarjan(compiled.start, successors, probs)
+    # Acyclic funnels: every module is its own component
+    reachable = [False] * len(compiled)
+    reachable[compiled.start] = True
+    found = []
+    for idx in order.tolist():
+        if reachable[idx]:
+            found.append([idx])
+            for target, prob in zip(successors[idx], probs[idx]):
+                if target >= 0 and prob:
+                    reachable[target] = True
+    return found
+
+def _tarjan(root, successors, probs):
+    # Iterative Tarjan from `root`; components come out downstream first
+    n = len(successors)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    found = []
+    counter = 0
+    work = [(root, 0)]
+    while work:
+        node, edge = work.pop()
+        if edge == 0:
+            index[node] = low[node] = counter
+            counter += 1
+            stack.append(node)
+            on_stack[node] = True
+        if edge < 2:
+            work.append((node, edge + 1))
+            target = successors[node][edge]
+            if target >= 0 and probs[node][edge]:
+                if index[target] < 0:
+                    work.append((target, 0))
+                elif on_stack[target]:
+                    low[node] = min(low[node], index[target])
+            continue
+        if low[node] == index[node]:
+            component = []
+            while True:
+                member = stack.pop()
+                on_stack[member] = False
+                component.append(member)
+                if member == node:
+                    break
+            found.append(component[::-1])
+        if work:
+            parent = work[-1][0]
+            low[parent] = min(low[parent], low[node])
+    return found[::-1]
+
+def _solve(compiled, rhs, success_rate=None, transpose=False):
+    # Solve (I - Q) x = rhs, or (I - Q^T) x = rhs with transpose=True, for
+    # a (modules,) or (modules, k) right-hand side, over the reachable
+    # modules. The transposed system pushes flow downstream, so components
+    # are taken upstream first; the plain one collects values from
+    # downstream, so in reverse. Modules off any loop need no solve at
+    # all, just a few multiply-adds.
+    rates = compiled.success_rate if success_rate is None else np.asarray(success_rate, dtype=float)
+    successors = np.column_stack((compiled.next_on_success, compiled.next_on_failure)).tolist()
+    probs = np.column_stack((rates, 1 - rates)).tolist()
+    rhs = np.asarray(rhs, dtype=float)
+    width = rhs.size // len(compiled)
+    source = rhs.reshape(len(compiled), width).tolist()
+    rows = [[0.0] * width for _ in range(len(compiled))]
+
+    comps = components(compiled, successors, probs)
+    for members in (comps if transpose else reversed(comps)):
+        if len(members) == 1 and members[0] not in successors[members[0]]:
+            idx = members[0]
+            row = [a + b for a, b in zip(rows[idx], source[idx])]
+            for target, prob in zip(successors[idx], probs[idx]):
+                if target < 0 or not prob:
+                    continue
+                if transpose:
+                    rows[target] = [a + prob * b for a, b in zip(rows[target], row)]
+                else:
+                    row = [a + prob * b for a, b in zip(row, rows[target])]
+            rows[idx] = row
+            continue
+
+        # Modules on a shared loop: one small dense solve for the block
+        position = {idx: k for k, idx in enumerate(members)}
+        block = np.zeros((len(members), len(members)))
+        values = np.array([rows[idx] for idx in members]) + np.array([source[idx] for idx in members])
+        outside = []
+        leaves = False
+        for k, idx in enumerate(members):
+            for target, prob in zip(successors[idx], probs[idx]):
+                if not prob:
+                    continue
+                if target in position:
+                    block[k, position[target]] += prob
+                else:
+                    leaves = True
+                    if target >= 0:
+                        outside.append((k, target, prob))
+        if not leaves:
+            names = ', '.join(compiled.names[idx] for idx in members)
+            raise ValueError(f"Funnel has a loop that customers can never leave: {names}")
+        if not transpose:
+            for k, target, prob in outside:
+                values[k] += prob * np.asarray(rows[target])
+        values = np.linalg.solve(np.eye(len(members)) - (block.T if transpose else block), values)
+        for k, idx in enumerate(members):
+            rows[idx] = values[k].tolist()
+        if transpose:
+            for k, target, prob in outside:
+                rows[target] = [a + prob * b for a, b in zip(rows[target], rows[members[k]])]
+    return np.array(rows).reshape(rhs.shape)
+
+def solve_flow(compiled, inflow, success_rate=None):
+    # (I - Q^T)^-1 inflow: total flow through each module when `inflow`
+    # enters at the modules and follows the edges, retries included
+    return _solve(compiled, inflow, success_rate, transpose=True)
+
+def solve_value(compiled, reward, success_rate=None):
+    # (I - Q)^-1 reward: `reward` per visit, summed over every module still
+    # to be visited from each module, that module included
+    return _solve(compiled, reward, success_rate)
+
+def expected_visits(compiled, success_rate=None):
+    # Row `start` of N: expected number of times a customer entering at the
+    # start module passes through each module, retries included.
+    start = np.zeros(len(compiled))
+    start[compiled.start] = 1.0
+    return solve_flow(compiled, start, success_rate)
+
+def absorption_vectors(compiled, success_rate=None):
+    # One-step probability of leaving each module into each absorbing state
+    rates = compiled.success_rate if success_rate is None else np.asarray(success_rate, dtype=float)
+    to_success = np.where(compiled.next_on_success == SUCCESS, rates, 0.0)
+    to_failed = np.where(compiled.next_on_failure == FAILED, 1 - rates, 0.0)
+    to_dropped = (
+        np.where(compiled.next_on_success == DROPPED, rates, 0.0)
+        + np.where(compiled.next_on_failure == DROPPED, 1 - rates, 0.0)
+    )
+    return to_success, to_failed, to_dropped
+
+def solve_absorbing(compiled, success_rate=None):
+    visits = expected_visits(compiled, success_rate)
+    to_success, to_failed, to_dropped = absorption_vectors(compiled, success_rate)
+    return {
+        'Success Probability': float(visits @ to_success),
+        'Failure Probability': float(visits @ to_failed),
+        'Dropped Probability': float(visits @ to_dropped),
+        'Expected Cost per Customer': float(visits @ compiled.cost),
+        'Expected Time per Customer': float(visits @ compiled.time),
+        'Expected Latency per Customer': float(visits @ compiled.wall_time),
+        'Expected Visits': dict(zip(compiled.names, visits.tolist())),
+    }
+
+def values_to_go(compiled, success_rate=None):
+    # Columns of N @ [to_success, cost, time]: from each module, the
+    # probability of eventually succeeding and the expected cost and time
+    # still to be spent (the module's own cost and time included).
+    to_success, _, _ = absorption_vectors(compiled, success_rate)
+    rhs = np.column_stack((to_success, compiled.cost, compiled.time))
+    return solve_value(compiled, rhs, success_rate)
+
+def sensitivity(compiled):
+    # Exact partial derivatives of the expected per-customer outcome with
+    # respect to every module parameter, from two linear solves instead of
+    # re-running the funnel once per parameter. Raising success_rate of
+    # module k moves v_k customers from its failure edge to its success edge,
+    # so the derivative is v_k times the difference in value-to-go.
+    visits = expected_visits(compiled)
+    to_go = values_to_go(compiled)
+    to_success, _, _ = absorption_vectors(compiled)
+    totals = visits @ np.column_stack((to_success, compiled.cost, compiled.time))
+
+    def after(edge):
+        # Value-to-go once a customer has taken `edge` out of each module;
+        # reaching Success is worth a success probability of 1.
+        value = np.zeros((len(edge), 3))
+        internal = edge >= 0
+        value[internal] = to_go[edge[internal]]
+        value[edge == SUCCESS, 0] = 1.0
+        return value
+
+    delta = after(compiled.next_on_success) - after(compiled.next_on_failure)
+
+    metrics = ['Success Probability', 'Expected Cost per Customer', 'Expected Time per Customer']
+    rows = []
+    for idx, name in enumerate(compiled.names):
+        entries = [
+            ('success_rate', compiled.success_rate[idx], metric, visits[idx] * delta[idx, col], totals[col])
+            for col, metric in enumerate(metrics)
+        ]
+        entries.append(('cost_per_transaction', compiled.cost[idx], metrics[1], visits[idx], totals[1]))
+        entries.append(('time_to_complete', compiled.time[idx], metrics[2], visits[idx], totals[2]))
+        for parameter, value, metric, derivative, total in entries:
+            rows.append({
+                'Module': name,
+                'Parameter': parameter,
+                'Metric': metric,
+                'Value': value,
+                'Derivative': derivative,
+                'Elasticity': derivative * value / total if total else 0.0,
+            })
+    return rows
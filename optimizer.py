@@ -0,0 +1,265 @@
+import itertools
+import math
+import random
+import numpy as np
+
+# Searches module orderings and routing for the cheapest funnel.
+#
+# Modules that share a `group` are alternative ways of passing the same
+# check (e.g. CKYC and Digilocker). A candidate funnel is an ordering of the
+# groups plus, for each group, an ordered subset of its members: customers
+# who fail a member fall back to the next one, and failing the last member
+# of a group is terminal. Every group must be passed to reach Success.
+#
+# With that structure a group reduces to three numbers (pass probability,
+# expected cost, expected time per customer entering it) and a funnel to a
+# chain of groups, so candidates are scored in O(1) to O(groups) from
+# prefix sums instead of by running the funnel.
+
+OBJECTIVES = ('cost_per_success', 'cost', 'latency')
+
+def _group_options(members):
+    # Every non-empty ordered subset of a group's members with its pass
+    # probability, expected cost and expected time per customer entering it
+    options = []
+    for size in range(1, len(members) + 1):
+        for chosen in itertools.permutations(members, size):
+            reach = 1.0
+            cost = time = 0.0
+            for module in chosen:
+                cost += reach * module['cost_per_transaction']
+                time += reach * module['time_to_complete']
+                reach *= 1 - module['success_rate']
+            options.append((chosen, 1 - reach, cost, time))
+    return options
+
+def _score(objective, success, cost, time):
+    if objective == 'cost_per_success':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(success > 0, cost / np.where(success > 0, success, 1), np.inf)
+    if objective == 'cost':
+        return cost
+    return time
+
+def _chain_totals(passes, costs, times):
+    # passes/costs/times: (candidates, groups) in funnel order
+    reach = np.cumprod(np.column_stack((np.ones(len(passes)), passes[:, :-1])), axis=1)
+    return passes.prod(axis=1), (reach * costs).sum(axis=1), (reach * times).sum(axis=1)
+
+class FunnelOptimizer:
+    def __init__(self, modules, precedence=(), objective='cost_per_success', min_success_rate=0.0):
+        if objective not in OBJECTIVES:
+            raise ValueError(f"objective must be one of {', '.join(OBJECTIVES)}")
+        self.objective = objective
+        self.min_success_rate = min_success_rate
+
+        groups = {}
+        for module in modules:
+            groups.setdefault(module.get('group') or module['name'], []).append(module)
+        self.group_names = list(groups)
+        self.options = [_group_options(members) for members in groups.values()]
+        self.option_pass = [np.array([o[1] for o in opts]) for opts in self.options]
+        self.option_cost = [np.array([o[2] for o in opts]) for opts in self.options]
+        self.option_time = [np.array([o[3] for o in opts]) for opts in self.options]
+
+        # Precedence pairs may name groups or member modules
+        group_of = {name: idx for idx, name in enumerate(self.group_names)}
+        for idx, members in enumerate(groups.values()):
+            for module in members:
+                group_of[module['name']] = idx
+        self.must_precede = set()
+        for before, after in precedence:
+            if before not in group_of or after not in group_of:
+                raise ValueError(f"Unknown module or group in precedence constraint: {before!r} -> {after!r}")
+            self.must_precede.add((group_of[before], group_of[after]))
+        self.evaluated = 0
+
+    def candidate_count(self):
+        orderings = math.factorial(len(self.group_names))
+        return orderings * math.prod(len(opts) for opts in self.options)
+
+    def _valid_order(self, order):
+        position = {group: pos for pos, group in enumerate(order)}
+        return all(position[before] < position[after] for before, after in self.must_precede)
+
+    def _evaluate(self, orders, choices):
+        # orders, choices: (candidates, groups) integer arrays
+        passes = np.empty(orders.shape)
+        costs = np.empty(orders.shape)
+        times = np.empty(orders.shape)
+        for group in range(len(self.group_names)):
+            at = orders == group
+            picked = choices[:, group]
+            passes[at] = np.broadcast_to(self.option_pass[group][picked][:, None], orders.shape)[at]
+            costs[at] = np.broadcast_to(self.option_cost[group][picked][:, None], orders.shape)[at]
+            times[at] = np.broadcast_to(self.option_time[group][picked][:, None], orders.shape)[at]
+        success, cost, time = _chain_totals(passes, costs, times)
+        score = _score(self.objective, success, cost, time)
+        self.evaluated += len(orders)
+        return np.where(success >= self.min_success_rate, score, np.inf), success, cost, time
+
+    def exhaustive(self, chunk_size=65536):
+        # Score every valid candidate in vectorized chunks
+        orders = [order for order in itertools.permutations(range(len(self.group_names))) if self._valid_order(order)]
+        if not orders:
+            raise ValueError("Precedence constraints cannot all be satisfied")
+        candidates = itertools.product(orders, itertools.product(*[range(len(opts)) for opts in self.options]))
+        best = None
+        while True:
+            chunk = list(itertools.islice(candidates, chunk_size))
+            if not chunk:
+                break
+            chunk_orders = np.array([order for order, _ in chunk], dtype=np.int64)
+            chunk_choices = np.array([choice for _, choice in chunk], dtype=np.int64)
+            score = self._evaluate(chunk_orders, chunk_choices)[0]
+            idx = int(np.argmin(score))
+            if best is None or score[idx] < best[0]:
+                best = (score[idx], chunk_orders[idx].tolist(), chunk_choices[idx].tolist())
+        self._check_feasible(best[0])
+        return best[1], best[2]
+
+    def _check_feasible(self, score):
+        # Candidates that miss min_success_rate (or never succeed, for
+        # cost_per_success) score inf; if that is the best, nothing qualifies
+        if not math.isfinite(score):
+            raise ValueError(f"No candidate funnel reaches min_success_rate {self.min_success_rate}")
+
+    def _initial(self):
+        # Greedy start: all members of every group, then the classic
+        # sequential-testing rule (cheapest cost per unit of rejection first)
+        # subject to precedence constraints
+        choices = [max(range(len(opts)), key=lambda o: (opts[o][1], -opts[o][2])) for opts in self.options]
+        ratio = [
+            self.option_cost[g][choices[g]] / max(1 - self.option_pass[g][choices[g]], 1e-12)
+            for g in range(len(self.group_names))
+        ]
+        remaining = set(range(len(self.group_names)))
+        order = []
+        while remaining:
+            ready = [g for g in remaining if not any(b == g and a in remaining for a, b in self.must_precede)]
+            if not ready:
+                raise ValueError("Precedence constraints cannot all be satisfied")
+            pick = min(ready, key=lambda g: ratio[g])
+            order.append(pick)
+            remaining.remove(pick)
+        return order, choices
+
+    def local_search(self, iterations=200000, seed=None, temperature=0.05):
+        # Simulated annealing over adjacent swaps and per-group option
+        # changes. Each move is scored in O(1) from prefix sums of the current
+        # chain; the chain is only rebuilt when a move is accepted.
+        rng = random.Random(seed)
+        order, choices = self._initial()
+        m = len(order)
+
+        def chain(order, choices):
+            passes = [float(self.option_pass[g][choices[g]]) for g in order]
+            costs = [float(self.option_cost[g][choices[g]]) for g in order]
+            times = [float(self.option_time[g][choices[g]]) for g in order]
+            reach = [1.0, *itertools.accumulate(passes, lambda a, b: a * b)]
+            # prefix[i] = cost (time) spent in the first i groups per customer
+            cost_prefix = [0.0, *itertools.accumulate(r * c for r, c in zip(reach, costs))]
+            time_prefix = [0.0, *itertools.accumulate(r * t for r, t in zip(reach, times))]
+            return passes, costs, times, reach, cost_prefix, time_prefix
+
+        def objective(success, cost, time):
+            if success < self.min_success_rate:
+                return math.inf
+            if self.objective == 'cost_per_success':
+                return cost / success if success > 0 else math.inf
+            return cost if self.objective == 'cost' else time
+
+        option_pass = [values.tolist() for values in self.option_pass]
+        option_cost = [values.tolist() for values in self.option_cost]
+        option_time = [values.tolist() for values in self.option_time]
+        passes, costs, times, reach, cost_prefix, time_prefix = chain(order, choices)
+        current = objective(reach[-1], cost_prefix[-1], time_prefix[-1])
+        best = (current, list(order), list(choices))
+        scale = abs(current) if math.isfinite(current) and current else 1.0
+
+        for step in range(iterations):
+            self.evaluated += 1
+            if m > 1 and rng.random() < 0.5:
+                pos = rng.randrange(m - 1)
+                if (order[pos], order[pos + 1]) in self.must_precede:
+                    continue
+                # Only the two swapped terms change; later groups see the same product
+                r = reach[pos]
+                new_cost = cost_prefix[-1] + r * (costs[pos + 1] + passes[pos + 1] * costs[pos] - costs[pos] - passes[pos] * costs[pos + 1])
+                new_time = time_prefix[-1] + r * (times[pos + 1] + passes[pos + 1] * times[pos] - times[pos] - passes[pos] * times[pos + 1])
+                new_success = reach[-1]
+                move = ('swap', pos)
+            else:
+                pos = rng.randrange(m)
+                group = order[pos]
+                option = rng.randrange(len(self.options[group]))
+                if option == choices[group]:
+                    continue
+                if passes[pos] > 0:
+                    # Downstream groups are reached in proportion to this group's pass rate
+                    factor = option_pass[group][option] / passes[pos]
+                    new_cost = cost_prefix[pos] + reach[pos] * option_cost[group][option] + factor * (cost_prefix[-1] - cost_prefix[pos + 1])
+                    new_time = time_prefix[pos] + reach[pos] * option_time[group][option] + factor * (time_prefix[-1] - time_prefix[pos + 1])
+                    new_success = reach[-1] * factor
+                else:
+                    trial = list(choices)
+                    trial[group] = option
+                    _, _, _, trial_reach, trial_cost, trial_time = chain(order, trial)
+                    new_cost, new_time, new_success = trial_cost[-1], trial_time[-1], trial_reach[-1]
+                move = ('option', group, option)
+
+            candidate = objective(new_success, new_cost, new_time)
+            heat = temperature * scale * (1 - step / iterations)
+            if candidate <= current or (math.isfinite(candidate) and heat > 0 and rng.random() < math.exp((current - candidate) / heat)):
+                if move[0] == 'swap':
+                    order[move[1]], order[move[1] + 1] = order[move[1] + 1], order[move[1]]
+                else:
+                    choices[move[1]] = move[2]
+                passes, costs, times, reach, cost_prefix, time_prefix = chain(order, choices)
+                current = candidate
+                if current < best[0]:
+                    best = (current, list(order), list(choices))
+        self._check_feasible(best[0])
+        return best[1], best[2]
+
+    def optimize(self, max_exhaustive=500000, iterations=200000, seed=None):
+        if self.candidate_count() <= max_exhaustive:
+            order, choices = self.exhaustive()
+        else:
+            order, choices = self.local_search(iterations=iterations, seed=seed)
+        return self.result(order, choices)
+
+    def result(self, order, choices):
+        # Materialize a candidate as config modules with routing filled in
+        sequence = [self.options[group][choices[group]][0] for group in order]
+        modules = []
+        for position, members in enumerate(sequence):
+            after_group = sequence[position + 1][0]['name'] if position + 1 < len(sequence) else "Success"
+            for rank, member in enumerate(members):
+                module = {key: value for key, value in member.items() if not key.startswith('next_module_on_') and key != 'is_start'}
+                module['is_start'] = position == 0 and rank == 0
+                module['next_module_on_success'] = after_group
+                module['next_module_on_failure'] = members[rank + 1]['name'] if rank + 1 < len(members) else "Failed"
+                modules.append(module)
+
+        passes = np.array([[self.option_pass[g][choices[g]] for g in order]])
+        costs = np.array([[self.option_cost[g][choices[g]] for g in order]])
+        times = np.array([[self.option_time[g][choices[g]] for g in order]])
+        success, cost, time = (float(v[0]) for v in _chain_totals(passes, costs, times))
+        return {
+            'modules': modules,
+            'score': float(_score(self.objective, np.float64(success), cost, time)),
+            'metrics': {
+                'Success Probability': success,
+                'Expected Cost per Customer': cost,
+                'Expected Time per Customer': time,
+                'Cost per Success': cost / success if success else math.inf,
+            },
+            'candidates_evaluated': self.evaluated,
+        }
+
+def optimize_funnel(funnel, precedence=(), objective='cost_per_success', min_success_rate=0.0, **kwargs):
+    # Reorder the modules of an existing Funnel; module routing in the
+    # config is ignored and rebuilt from `group` membership
+    optimizer = FunnelOptimizer(funnel.config['modules'], precedence, objective, min_success_rate)
+    return optimizer.optimize(**kwargs)
@@ -0,0 +1,78 @@
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Opt-in instrumentation of simulation phases. Code paths take an optional
+# `profiler` and wrap their phases in `phase(profiler, name)`, which does
+# nothing when no profiler is given. Phases nest; a nested phase is
+# recorded as "outer/inner" and repeated phases are aggregated.
+
+class Profiler:
+    def __init__(self, track_memory=True):
+        # track_memory uses tracemalloc for peak memory, which slows the
+        # profiled code down; block counts and timings are always recorded
+        self.track_memory = track_memory
+        self.phases = {}
+        self._stack = []
+        self._owns_tracing = False
+
+    @contextmanager
+    def phase(self, name):
+        path = '/'.join([*(frame['path'] for frame in self._stack[-1:]), name])
+        if self.track_memory and not self._stack and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        # Register on entry so phases list in the order they started
+        record = self.phases.setdefault(path, {'calls': 0, 'seconds': 0.0, 'net_blocks': 0, 'peak_bytes': None})
+        frame = {'path': path, 'peak': 0}
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self._record_peak(peak)
+            tracemalloc.reset_peak()
+            frame['start_memory'] = current
+        self._stack.append(frame)
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            seconds = time.perf_counter() - start
+            net_blocks = sys.getallocatedblocks() - blocks
+            if tracemalloc.is_tracing():
+                _, peak = tracemalloc.get_traced_memory()
+                self._record_peak(peak)
+                tracemalloc.reset_peak()
+            self._stack.pop()
+            # Peaks seen inside this phase also count for the enclosing ones
+            self._record_peak(frame['peak'])
+
+            record['calls'] += 1
+            record['seconds'] += seconds
+            record['net_blocks'] += net_blocks
+            if 'start_memory' in frame:
+                peak_bytes = max(frame['peak'] - frame['start_memory'], 0)
+                record['peak_bytes'] = max(record['peak_bytes'] or 0, peak_bytes)
+            if not self._stack and self._owns_tracing:
+                tracemalloc.stop()
+                self._owns_tracing = False
+
+    def _record_peak(self, peak):
+        for frame in self._stack:
+            frame['peak'] = max(frame['peak'], peak)
+
+    def to_frame(self):
+        import pandas as pd
+        return pd.DataFrame([
+            {
+                'Phase': path,
+                'Calls': record['calls'],
+                'Seconds': record['seconds'],
+                'Net Allocated Blocks': record['net_blocks'],
+                'Peak Memory (MB)': record['peak_bytes'] / 2 ** 20 if record['peak_bytes'] is not None else None,
+            }
+            for path, record in self.phases.items()
+        ], columns=['Phase', 'Calls', 'Seconds', 'Net Allocated Blocks', 'Peak Memory (MB)'])
+
+def phase(profiler, name):
+    return profiler.phase(name) if profiler is not None else nullcontext()
@@ -0,0 +1,112 @@
+import importlib.util
+import os
+import numpy as np
+from engine import SUCCESS, FAILED, DROPPED
+from markov import expected_visits, solve_flow
+
+# Replays a time series of arrival counts (e.g. a year of forecast daily
+# sign-ups) through the funnel. Every period is one scenario of a single
+# batched propagation, and module activity is then moved into the period
+# in which it actually happens, using each module's mean offset from the
+# moment a customer enters the funnel.
+
+def require_parquet():
+    # pandas reads and writes Parquet through pyarrow or fastparquet,
+    # neither of which is a required dependency
+    if not any(importlib.util.find_spec(engine) for engine in ('pyarrow', 'fastparquet')):
+        raise ValueError("Parquet files need the pyarrow or fastparquet package")
+
+def load_arrivals(path, column):
+    # Arrival counts from a column of a CSV or Parquet file
+    import pandas as pd
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.parquet':
+        require_parquet()
+        frame = pd.read_parquet(path, columns=[column])
+    elif extension == '.csv':
+        frame = pd.read_csv(path, usecols=[column])
+    else:
+        raise ValueError(f"Unsupported arrivals file type: {extension or path}")
+    return frame[column]
+
+def entry_offsets(compiled):
+    # Mean seconds from entering the funnel to entering each module,
+    # averaged over every visit (retries included). With v the expected
+    # visits and Q the transition matrix, the summed entry times a satisfy
+    # a = Q^T (a + v * wall_time), so u = a + v * wall_time solves
+    # (I - Q^T) u = v * wall_time.
+    visits = expected_visits(compiled)
+    own = visits * compiled.wall_time
+    summed = solve_flow(compiled, own) - own
+    return np.divide(summed, visits, out=np.zeros_like(summed), where=visits > 0)
+
+def _shift(values, offsets, period_seconds, periods):
+    # Move (arrival period, module) counts to the period they occur in.
+    # Arrivals are spread evenly over their period, so an offset of k
+    # periods plus a fraction f sends a share f of them one period further.
+    whole = np.floor(offsets / period_seconds).astype(np.int64)
+    late = np.rint(values * (offsets / period_seconds - whole)).astype(np.int64)
+    shifted = np.zeros((periods, values.shape[1]), dtype=np.int64)
+    n_arrival_periods = values.shape[0]
+    for k in np.unique(whole).tolist():
+        cols = np.flatnonzero(whole == k)
+        shifted[k:k + n_arrival_periods, cols] += values[:, cols] - late[:, cols]
+        shifted[k + 1:k + 1 + n_arrival_periods, cols] += late[:, cols]
+    return shifted
+
+def replay_periods(compiled, arrivals, entered, passed, period_seconds=86400):
+    # arrivals: (arrival periods,); entered/passed: (arrival periods,
+    # modules) counts. Modules are charged in the period customers enter
+    # them; passes, failures and final outcomes land when they finish.
+    import pandas as pd
+    start_offset = entry_offsets(compiled)
+    finish_offset = start_offset + compiled.wall_time
+    periods = arrivals.size + int(np.floor(finish_offset.max() / period_seconds)) + 1
+
+    failed = entered - passed
+    entered = _shift(entered, start_offset, period_seconds, periods)
+    passed = _shift(passed, finish_offset, period_seconds, periods)
+    failed = _shift(failed, finish_offset, period_seconds, periods)
+    # Drop trailing periods with no activity left
+    active = np.flatnonzero(entered.any(axis=1) | passed.any(axis=1) | failed.any(axis=1))
+    periods = max(arrivals.size, int(active[-1]) + 1 if active.size else 0)
+    entered, passed, failed = entered[:periods], passed[:periods], failed[:periods]
+
+    final_success = np.where(compiled.next_on_success == SUCCESS, passed, 0)
+    terminally_rejected = np.where(compiled.next_on_failure == FAILED, failed, 0)
+    dropped = (
+        np.where(compiled.next_on_success == DROPPED, passed, 0)
+        + np.where(compiled.next_on_failure == DROPPED, failed, 0)
+    )
+    total_cost = entered * compiled.cost
+    total_time = entered * compiled.time
+
+    # Per-period, per-module table for every module the funnel reaches
+    visited = np.flatnonzero(entered.any(axis=0))
+    period_index = np.repeat(np.arange(periods), visited.size)
+    module_results = pd.DataFrame({
+        "Period": period_index,
+        "Module": np.tile(np.array(compiled.names, dtype=object)[visited], periods),
+        "Enter Funnel": entered[:, visited].ravel(),
+        "Pass": passed[:, visited].ravel(),
+        "Fail": failed[:, visited].ravel(),
+        "Final Success": final_success[:, visited].ravel(),
+        "Terminally Rejected": terminally_rejected[:, visited].ravel(),
+        "Total Cost": total_cost[:, visited].ravel(),
+        "Total Time": total_time[:, visited].ravel(),
+    })
+
+    success = final_success.sum(axis=1)
+    cost = total_cost.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cost_per_success = np.where(success > 0, cost / success, np.nan)
+    period_summary = pd.DataFrame({
+        "Period": np.arange(periods),
+        "Arrivals": np.concatenate((arrivals, np.zeros(periods - arrivals.size, dtype=np.int64))),
+        "Total Success": success,
+        "Total Failures": terminally_rejected.sum(axis=1) + dropped.sum(axis=1),
+        "Total Cost": cost,
+        "Total Time": total_time.sum(axis=1) / 60,  # minutes
+        "Cost per Success": cost_per_success,
+    })
+    return module_results, period_summary
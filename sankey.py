@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+# Builds Sankey nodes and links from a results table in a few grouped
+# operations. Rows for the same module (e.g. several runs or segments
+# concatenated) are summed, and parallel links between the same two nodes
+# with the same outcome are merged. Above max_modules, the modules with the
+# fewest customers are collapsed into one OTHER node.
+
+START, SUCCESS, FAILED, OTHER = 'Start', 'Success', 'Failed', 'Other'
+
+def sankey_data(results_df, max_modules=None):
+    # Returns (labels, links): node labels, then a DataFrame with integer
+    # source and target node indices, value, outcome ('start', 'passed' or
+    # 'failed') and a hover label for each link
+    modules = results_df.groupby('Module', sort=False).agg({
+        'Enter Funnel': 'sum', 'Pass': 'sum', 'Fail': 'sum',
+        'Next Module on Success': 'first', 'Next Module on Failure': 'first'
+    })
+    names = modules.index
+
+    # Targets named "Success" or "Failed" go to that terminal whichever edge
+    # they are on; a next module that is missing or not in the table ends
+    # the path in the terminal matching the edge
+    targets = list(names) + [SUCCESS, FAILED]
+    success_targets = modules['Next Module on Success'].where(
+        modules['Next Module on Success'].isin(targets), SUCCESS
+    )
+    failure_targets = modules['Next Module on Failure'].where(
+        modules['Next Module on Failure'].isin(targets), FAILED
+    )
+    links = pd.concat([
+        pd.DataFrame({'source': names, 'target': success_targets.to_numpy(),
+                      'value': modules['Pass'].to_numpy(), 'outcome': 'passed'}),
+        pd.DataFrame({'source': names, 'target': failure_targets.to_numpy(),
+                      'value': modules['Fail'].to_numpy(), 'outcome': 'failed'}),
+    ], ignore_index=True)
+
+    # Whatever enters a module but did not come from another module came
+    # from Start; this also holds for loops and several start modules
+    inflow = links.groupby('target')['value'].sum().reindex(names, fill_value=0)
+    start_value = modules['Enter Funnel'] - inflow
+    links = pd.concat([
+        pd.DataFrame({'source': START, 'target': names, 'value': start_value.to_numpy(), 'outcome': 'start'}),
+        links,
+    ], ignore_index=True)
+    links = links[links['value'] > 0]
+
+    entered = modules['Enter Funnel']
+    kept = list(names)
+    if max_modules is not None and len(names) > max_modules:
+        kept = set(entered.nlargest(max_modules).index)
+        kept = [name for name in names if name in kept]
+        node = pd.Series(OTHER, index=names)
+        node[kept] = kept
+        node = pd.concat([node, pd.Series([START, SUCCESS, FAILED], index=[START, SUCCESS, FAILED])])
+        links = links.assign(source=links['source'].map(node), target=links['target'].map(node))
+        # Flows between collapsed modules stay inside OTHER
+        links = links[(links['source'] != OTHER) | (links['target'] != OTHER)]
+        entered = pd.concat([
+            entered[kept],
+            pd.Series({OTHER: entered.drop(kept).sum()}),
+        ])
+        kept = kept + [OTHER]
+
+    links = links.groupby(['source', 'target', 'outcome'], sort=False, as_index=False)['value'].sum()
+
+    labels = [START] + kept + [SUCCESS, FAILED]
+    index = pd.Series(np.arange(len(labels)), index=labels)
+    source_entered = links['source'].map(entered)
+    percentage = (links['value'] / source_entered * 100).map('{:.1f}'.format)
+    links['label'] = np.where(
+        links['outcome'] == 'start',
+        links['value'].astype(str) + ' customers',
+        links['value'].astype(str) + ' (' + percentage + '%) ' + links['outcome'],
+    )
+    links['source'] = index[links['source']].to_numpy()
+    links['target'] = index[links['target']].to_numpy()
+    return labels, links[['source', 'target', 'value', 'outcome', 'label']]
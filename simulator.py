@@ -1,7 +1,56 @@
-from funnel import Funnel
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from cache import load_funnel
+from profiling import Profiler, phase
 
-def simulate_onboarding(customers_count, config_path):
-    funnel = Funnel(config_path)
-    results, summary_stats = funnel.run_funnel(customers_count)
-    path_metrics = funnel.compute_path_metrics()
+def simulate_onboarding(customers_count, config_path, top_k_paths=None, verbose=True, profile=False, fractional=False):
+    # With profile=True, per-phase timings and memory are recorded and
+    # returned as summary_stats['profile'] (a profiling.Profiler).
+    # fractional=True propagates expected counts and rounds only the report.
+    profiler = Profiler() if profile else None
+    with phase(profiler, 'load funnel'):
+        funnel = load_funnel(config_path, profiler)
+    with phase(profiler, 'run funnel'):
+        results, summary_stats = funnel.run_funnel(
+            customers_count, verbose=verbose, profiler=profiler, fractional=fractional
+        )
+    # Full enumeration grows exponentially with branching; large funnels
+    # can ask for only the most probable paths instead.
+    with phase(profiler, 'path metrics'):
+        if top_k_paths:
+            path_metrics = funnel.top_k_paths(top_k_paths)
+        else:
+            path_metrics = funnel.compute_path_metrics()
+    with phase(profiler, 'absorption metrics'):
+        summary_stats['expected'] = funnel.absorption_metrics()
+    if profiler is not None:
+        summary_stats['profile'] = profiler
     return results, summary_stats, path_metrics
+
+def simulate_many(customers_count, config_paths, max_workers=None, top_k_paths=None, profile=False, fractional=False):
+    # Run one simulation per config in a process pool; results come back in
+    # the same order as config_paths. max_workers=1 runs serially in-process.
+    # Workers are spawned rather than forked: the Streamlit server that
+    # calls this is multi-threaded, and forking a threaded process can
+    # deadlock. There is never more than one worker per config.
+    config_paths = list(config_paths)
+    if max_workers == 1 or len(config_paths) <= 1:
+        return [
+            simulate_onboarding(customers_count, config_path, top_k_paths, profile=profile, fractional=fractional)
+            for config_path in config_paths
+        ]
+    max_workers = min(max_workers or multiprocessing.cpu_count(), len(config_paths))
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return list(executor.map(
+            simulate_onboarding,
+            [customers_count] * len(config_paths), config_paths, [top_k_paths] * len(config_paths),
+            [True] * len(config_paths), [profile] * len(config_paths), [fractional] * len(config_paths)
+        ))
+
+def simulate_batch(scenarios, config_path, columns=None, customers_count=None):
+    funnel = load_funnel(config_path)
+    return funnel.run_batch(scenarios, columns=columns, customers_count=customers_count)
+
+def simulate_replay(arrivals, config_path, period_seconds=86400):
+    funnel = load_funnel(config_path)
+    return funnel.replay(arrivals, period_seconds=period_seconds)
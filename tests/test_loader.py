@@ -0,0 +1,102 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loader import ConfigError, validate_config
+
+# validate_config raises one ConfigError listing every problem in a config
+
+def module(name, on_success='Success', on_failure='Failed', **extra):
+    return {
+        'name': name, 'success_rate': 0.5, 'cost_per_transaction': 1.0,
+        'time_to_complete': 10, 'next_module_on_success': on_success,
+        'next_module_on_failure': on_failure, **extra
+    }
+
+def errors(config):
+    with pytest.raises(ConfigError) as info:
+        validate_config(config)
+    return info.value.errors
+
+def test_valid_config_passes():
+    validate_config({'modules': [module('A', 'B', is_start=True), module('B')]})
+
+def test_lists_every_problem():
+    config = {
+        'modules': [
+            module('A', 'B', 'Nowhere', is_start=True),
+            module('B', 'Failed', 'Success', success_rate=1.5, capacity=0),
+            module('B', time_to_complete='slow'),
+            module('Success', cost_per_transaction=-1, is_start=True),
+            'not a module',
+        ],
+        'arrival_rate': 0,
+    }
+    assert errors(config) == [
+        "module 'B' has success_rate 1.5 outside [0, 1]",
+        "module 'B' has capacity 0; use a positive integer",
+        "module 'B' is defined more than once",
+        "module 'B' needs a numeric time_to_complete",
+        "module 'Success' uses a reserved terminal name",
+        "module 'Success' has negative cost_per_transaction -1",
+        "modules[4] is not a mapping",
+        "module 'A' has unknown next_module_on_failure 'Nowhere'",
+        "module 'B' sends successful customers to 'Failed'",
+        "module 'B' sends failed customers to 'Success'",
+        "only one start module is allowed, found 2: A, Success",
+        "arrival_rate 0 must be a positive number",
+    ]
+
+@pytest.mark.parametrize('config, message', [
+    (None, "config needs a non-empty 'modules' list"),
+    ({'modules': []}, "config needs a non-empty 'modules' list"),
+    ({'modules': [module('A')]}, "no module has is_start: true"),
+    ({'modules': [module('A', 5, is_start=True)]}, "module 'A' has next_module_on_success 5; use a module name"),
+    ({'modules': [module('A', ['B'], is_start=True)]}, "module 'A' has next_module_on_success ['B']; use a module name"),
+    ({'modules': [module(None, is_start=True)]}, "modules[0] needs a name"),
+    ({'modules': [module('A', success_rate=True, is_start=True)]}, "module 'A' needs a numeric success_rate"),
+])
+def test_single_problem(config, message):
+    assert errors(config) == [message]
+
+def test_segment_problems():
+    config = {
+        'modules': [
+            module('A', 'B', is_start=True, segment_success_rates={'web': 1.2, 'tv': 0.5}),
+            module('B', segment_success_rates=[0.5]),
+        ],
+        'segments': [{'name': 'web', 'share': 0}, {'name': 'web', 'share': 1}, {'share': 1}],
+    }
+    assert errors(config) == [
+        "segment 'web' needs a positive share",
+        "segment 'web' is defined more than once",
+        "segments[2] needs a name",
+        "module 'A' has segment 'web' success rate 1.2 outside [0, 1]",
+        "module 'A' has a rate for unknown segment 'tv'",
+        "module 'B' has segment_success_rates [0.5]; use a mapping of segment to rate",
+    ]
+
+def parallel_config():
+    # X runs before the parallel group A, B
+    return {'modules': [
+        module('X', 'A', 'Failed', is_start=True),
+        module('A', 'B', 'Failed', is_parallel=True),
+        module('B', 'Success', 'Failed', is_parallel=True),
+    ]}
+
+def test_parallel_group_entered_at_head():
+    validate_config(parallel_config())
+
+def test_parallel_group_entered_in_the_middle():
+    config = parallel_config()
+    config['modules'][0]['next_module_on_failure'] = 'B'
+    assert errors(config) == ["module 'B' follows 'A' in a parallel group; customers can only enter it from 'A'"]
+
+def test_parallel_group_started_in_the_middle():
+    config = parallel_config()
+    config['modules'][0]['is_start'] = False
+    config['modules'][2]['is_start'] = True
+    assert len(errors(config)) == 1
@@ -0,0 +1,101 @@
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from funnel import Funnel
+from markov import expected_visits, values_to_go, absorption_vectors
+
+# The component-wise solver against the dense fundamental matrix
+# N = (I - Q)^-1 over the modules reachable from the start.
+
+def module(name, rate, on_success, on_failure, **extra):
+    return {
+        'name': name, 'success_rate': rate, 'cost_per_transaction': 2.0,
+        'time_to_complete': 10, 'next_module_on_success': on_success,
+        'next_module_on_failure': on_failure, **extra
+    }
+
+def dense_reference(compiled):
+    n = len(compiled)
+    q = np.zeros((n, n))
+    for idx in range(n):
+        rate = compiled.success_rate[idx]
+        for target, prob in ((compiled.next_on_success[idx], rate), (compiled.next_on_failure[idx], 1 - rate)):
+            if target >= 0:
+                q[idx, target] += prob
+    reachable = np.zeros(n, dtype=bool)
+    reachable[compiled.start] = True
+    for _ in range(n):
+        reachable |= (q[reachable] > 0).any(axis=0)
+    system = np.eye(reachable.sum()) - q[np.ix_(reachable, reachable)]
+    return reachable, system, q
+
+def random_config(rng, n):
+    names = [f"M{i}" for i in range(n)]
+    return {'modules': [
+        module(name, rng.choice([0.0, 0.3, 0.5, 0.9, 1.0]),
+               rng.choice(names + ['Success', None]), rng.choice(names + ['Failed', None]),
+               is_start=i == 0)
+        for i, name in enumerate(names)
+    ]}
+
+@pytest.mark.parametrize('seed', range(200))
+def test_matches_dense_solve(seed):
+    rng = random.Random(seed)
+    compiled = Funnel(None, config=random_config(rng, rng.randint(1, 10))).compiled
+    reachable, system, _ = dense_reference(compiled)
+    if np.linalg.cond(system) > 1e10:
+        # Some reachable loop has no way out
+        with pytest.raises(ValueError, match="never leave"):
+            expected_visits(compiled)
+        return
+
+    start = np.zeros(reachable.sum())
+    start[np.flatnonzero(reachable) == compiled.start] = 1.0
+    visits = np.zeros(len(compiled))
+    visits[reachable] = np.linalg.solve(system.T, start)
+    np.testing.assert_allclose(expected_visits(compiled), visits, atol=1e-9)
+
+    to_success, _, _ = absorption_vectors(compiled)
+    rhs = np.column_stack((to_success, compiled.cost, compiled.time))
+    to_go = np.zeros((len(compiled), 3))
+    to_go[reachable] = np.linalg.solve(system, rhs[reachable])
+    np.testing.assert_allclose(values_to_go(compiled), to_go, atol=1e-9)
+
+@pytest.mark.filterwarnings('ignore:.*loop forever')
+def test_reachable_trap_raises():
+    # M0 either fails out or enters a loop with no exit
+    config = {'modules': [
+        module('M0', 0.49, 'M2', 'Failed', is_start=True),
+        module('M1', 0.5, 'M2', 'M3'),
+        module('M2', 0.5, 'M1', 'M3'),
+        module('M3', 0.5, 'M1', 'M2'),
+    ]}
+    funnel = Funnel(None, config=config)
+    for call in (funnel.absorption_metrics, funnel.sensitivity_report, lambda: funnel.replay([10, 10])):
+        with pytest.raises(ValueError, match="never leave"):
+            call()
+
+@pytest.mark.filterwarnings('ignore:.*loop forever')
+def test_unreachable_closed_loop_is_ignored():
+    modules = [
+        module('A', 0.8, 'B', 'Failed', is_start=True),
+        module('B', 0.5, 'Success', 'A'),
+    ]
+    orphans = [module('Orphan1', 0.5, 'Orphan2', 'Orphan2'), module('Orphan2', 0.5, 'Orphan1', 'Orphan1')]
+    plain = Funnel(None, config={'modules': modules})
+    with_orphans = Funnel(None, config={'modules': modules + orphans})
+
+    expected = plain.absorption_metrics()
+    metrics = with_orphans.absorption_metrics()
+    for key, value in expected.items():
+        if key != 'Expected Visits':
+            assert metrics[key] == pytest.approx(value)
+    assert metrics['Expected Visits']['Orphan1'] == 0.0
+    assert len(with_orphans.sensitivity_report()) == 5 * 4
+    with_orphans.replay([10, 20])
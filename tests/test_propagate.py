@@ -0,0 +1,83 @@
+import os
+import sys
+import warnings
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from funnel import Funnel
+
+# Batched propagation runs every scenario as its own column; a batch must
+# give the same results as running each scenario alone, including when
+# rounding leaves some scenarios' customers stuck in a retry loop.
+
+def module(name, rate, on_success, on_failure, **extra):
+    return {
+        'name': name, 'success_rate': rate, 'cost_per_transaction': 1.0,
+        'time_to_complete': 10, 'next_module_on_success': on_success,
+        'next_module_on_failure': on_failure, **extra
+    }
+
+def retry_config():
+    # One customer failing A or C at 40% is sent back round the loop forever
+    return {'modules': [
+        module('A', 0.4, 'B', 'A', is_start=True),
+        module('B', 0.7, 'Success', 'C'),
+        module('C', 0.4, 'B', 'C'),
+    ]}
+
+def diamond_config():
+    # B and C both lead to D
+    return {'modules': [
+        module('A', 0.5, 'B', 'C', is_start=True),
+        module('B', 0.5, 'D', 'Failed'),
+        module('C', 0.5, 'D', 'Failed'),
+        module('D', 0.25, 'Success', 'Failed'),
+    ]}
+
+ARRIVALS = [295, 7, 105, 1, 0, 60, 2]
+
+def quietly(call, *args, **kwargs):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return call(*args, **kwargs)
+
+def test_batch_matches_single_runs():
+    compiled = Funnel(None, config=retry_config()).compiled
+    _, entered, passed = quietly(compiled.propagate, np.array(ARRIVALS))
+    for row, count in enumerate(ARRIVALS):
+        _, single_entered, single_passed = quietly(compiled.propagate, count)
+        np.testing.assert_array_equal(entered[row], single_entered)
+        np.testing.assert_array_equal(passed[row], single_passed)
+
+def test_run_batch_matches_single_runs():
+    funnel = Funnel(None, config=retry_config())
+    batch = quietly(funnel.run_batch, np.array(ARRIVALS)[:, None], columns=['customers_count'])
+    for row, count in enumerate(ARRIVALS):
+        single = quietly(funnel.run_batch, [[count]], columns=['customers_count'])
+        assert batch.iloc[row].to_dict() == pytest.approx(single.iloc[0].to_dict(), nan_ok=True)
+
+def test_stuck_customers_warn_and_leave():
+    compiled = Funnel(None, config=retry_config()).compiled
+    with pytest.warns(RuntimeWarning, match="loop forever"):
+        _, entered, _ = compiled.propagate(1)
+    # The customer fails A once and is dropped on its way back in
+    assert entered.tolist() == [1, 0, 0]
+
+def test_branches_are_rounded_per_visit_unless_pooled():
+    funnel = Funnel(None, config=diamond_config())
+    # 7 customers split 4/3 at A, and B and C each pass 2 on to D: two
+    # visits of 2 at 25% round to 0 each, one pooled visit of 4 passes 1
+    assert funnel.run(7).metrics()['Total Success'] == 0
+    assert funnel.run(7, pool=True).metrics()['Total Success'] == 1
+    assert funnel.run(7).entered.tolist() == [7, 4, 3, 4]
+
+def test_max_steps_limits_runs_with_loops():
+    funnel = Funnel(None, config=retry_config())
+    with pytest.raises(ValueError, match="raise max_steps"):
+        funnel.run(100, fractional=True, max_steps=5)
+    with pytest.raises(ValueError, match="raise max_steps"):
+        funnel.run_monte_carlo(100, replications=10, seed=1, max_steps=2)
+    assert funnel.run(100, fractional=True).metrics()['Total Success'] == 100